@@ -1,15 +1,90 @@
+import os
 from flask import Flask, request, abort, jsonify
 from flask_cors import CORS
 from model import *
-from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 
-from auth.auth import AuthError, requires_auth
+from auth.auth import AuthError, jwks_store, requires_auth, token_cache
+from compression import init_compression
+from instrumentation import init_instrumentation
+from json_encoding import init_json, json_response
+from metrics import CONTENT_TYPE, init_metrics
+from pagination import select_rows
+from profiling import init_profiling
+from response_cache import cached, init_response_cache
+from streaming import export_response
+from validation import (ValidationError, actor_fields, actor_updates,
+                        cast_fields, movie_fields, movie_updates, parse_id,
+                        parse_request_count, star_fields)
+
+
+STARRING_VIOLATIONS = {
+    'starring_cast_id_fkey': "Cast id does not exist",
+    'starring_actor_id_fkey': "Actor id does not exist",
+    'uq_starring_cast_id_actor_id': "Actor is already assigned to Cast"
+}
+
+
+def cast_violations(movie_id):
+    return {
+        'casts_movie_id_fkey': "Movie id is invalid, please enter a valid "
+                               "Movie id",
+        'casts_movie_id_key': "Duplicate key Violation, Movie id {} already "
+                              "assigned to a cast".format(movie_id)
+    }
 
 
 def create_app(test_config=None):
     app = Flask(__name__)
+    app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 100))
+    app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+    app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE',
+                                                         1000))
+    app.config['MAX_BULK_SIZE'] = int(os.environ.get('MAX_BULK_SIZE', 1000))
+    app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')
+    app.config['RESPONSE_CACHE'] = os.environ.get('RESPONSE_CACHE', 'off')
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get(
+        'RESPONSE_CACHE_SIZE', 512))
+    app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get(
+        'RESPONSE_CACHE_TTL', 300))
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE',
+                                                         1024))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get(
+        'COMPRESS_BROTLI_QUALITY', 4))
+    app.config['SERVER_TIMING'] = os.environ.get(
+        'SERVER_TIMING', 'on').lower() in ('1', 'on', 'true', 'yes')
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+    app.config['SLOW_QUERY_MS'] = (float(os.environ['SLOW_QUERY_MS'])
+                                   if os.environ.get('SLOW_QUERY_MS')
+                                   else None)
+    app.config['SLOW_QUERY_LOG_SIZE'] = int(os.environ.get(
+        'SLOW_QUERY_LOG_SIZE', 100))
+    app.config['SLOW_QUERY_EXPLAIN'] = os.environ.get(
+        'SLOW_QUERY_EXPLAIN', 'off').lower() in ('1', 'on', 'true', 'yes')
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+    app.config['PROFILER'] = os.environ.get('PROFILER', 'cprofile')
+    app.config['PROFILE_INTERVAL'] = float(os.environ.get('PROFILE_INTERVAL',
+                                                          0.005))
+    app.config['PROFILE_MAX_REQUESTS'] = int(os.environ.get(
+        'PROFILE_MAX_REQUESTS', 100))
+    if test_config:
+        app.config.update(test_config)
     setup_db(app)
+    # Flask runs after_request hooks in the reverse order of their
+    # registration, so the instrumentation is registered before the json,
+    # cache and compression hooks to time the final response.
+    init_instrumentation(app)
+    init_json(app)
+    init_response_cache(app)
+    init_metrics(app, {
+        'jwks': jwks_store,
+        'token': token_cache,
+        'response': app.extensions['response_cache']
+    })
+    init_compression(app)
+    init_profiling(app)
 
     CORS(app, resources={r"/*": {"origins": "*"}})
 
@@ -21,21 +96,92 @@ def create_app(test_config=None):
                              'GET, POST, PATCH, DELETE, OPTIONS')
         return response
 
+    @app.route('/metrics')
+    def get_metrics():
+        """
+        Serves the request, database and cache metrics of all the workers in
+        the Prometheus text format. Not authenticated, so scrapers need no
+        token, restrict access to it at the proxy if needed.
+
+        :return: metrics
+        """
+        return app.response_class(app.extensions['metrics'].render(),
+                                  content_type=CONTENT_TYPE)
+
+    @app.route('/admin/slow-queries')
+    @requires_auth('get:slow-queries')
+    def get_slow_queries():
+        """
+        Lists the statements of this worker slower than SLOW_QUERY_MS, the
+        slowest first
+
+        :return: jsonify object
+        :rtype: jsonify
+        """
+        log = app.extensions.get('slow_queries')
+        if log is None:
+            abort(404)
+        return json_response({
+            'success': True,
+            'threshold_ms': log.threshold * 1000,
+            'slow_queries': log.records()
+        })
+
+    @app.route('/admin/profile', methods=['POST'])
+    @requires_auth('post:profile')
+    def post_profile():
+        """
+        Profiles the next `requests` requests handled by this worker, of
+        `endpoint` when given, and writes the profiles to PROFILE_DIR
+
+        :return: jsonify object
+        :rtype: jsonify
+        """
+        profiler = app.extensions.get('profiler')
+        if profiler is None:
+            abort(404)
+        request_body = request.json or {}
+        try:
+            requests = parse_request_count(
+                request_body.get('requests', 1),
+                app.config['PROFILE_MAX_REQUESTS'])
+        except ValidationError as error:
+            abort(400, str(error))
+        endpoint = request_body.get('endpoint')
+        if endpoint is not None and endpoint not in app.view_functions:
+            abort(400, "Unknown endpoint '{}'".format(endpoint))
+        profiler.arm(requests, endpoint)
+        return jsonify({
+            'success': True,
+            'pid': os.getpid(),
+            'requests': requests,
+            'endpoint': endpoint,
+            'profiler': profiler.mode,
+            'directory': profiler.directory
+        })
+
     @app.route('/actors')
     @requires_auth('get:actors')
+    @cached('actors')
     def get_actors():
         """
-        Fetches all actor record
+        Fetches a page of actor records or the records listed in the `ids`
+        argument, see `select_rows`
+
+        :return: jsonify object
+        :rtype: jsonify
         """
-        actors = db.session.query(Actors).all()
-        formatted_msg = [actor.format() for actor in actors]
-        return jsonify({
+        actors, selection = select_rows(column_query(Actors), Actors.id)
+        formatted_msg = [Actors.format_row(actor) for actor in actors]
+        return json_response({
             'success': True,
-            'actors': formatted_msg
-        }), 200
+            'actors': formatted_msg,
+            **selection
+        })
 
     @app.route('/actors/<int:actor_id>')
     @requires_auth('get:actors')
+    @cached('actors')
     def get_actor_by_id(actor_id):
         """
         Fetches actor record by id
@@ -56,70 +202,80 @@ def create_app(test_config=None):
 
     @app.route('/actors/nationality/<string:nationality>')
     @requires_auth('get:actors')
+    @cached('actors')
     def get_actor_by_nationality(nationality):
         """
-        Fetches actors record filtered by nationality
+        Fetches a page of actors record filtered by nationality, or those
+        listed in the `ids` argument, see `select_rows`
 
         :param nationality: actor nationality to filterby
         :type nationality: str
         :return: jsonify object
         :rtype: jsonify
         """
-        actors = db.session.query(Actors).filter(
-            Actors.nationality == nationality).all()
-        formatted_msg = []
-        if actors:
-            formatted_msg = [actor.format() for actor in actors]
-        return jsonify({
+        actors, selection = select_rows(column_query(Actors).filter(
+            Actors.nationality == nationality), Actors.id)
+        formatted_msg = [Actors.format_row(actor) for actor in actors]
+        return json_response({
             'success': True,
-            'actors': formatted_msg
-        }), 200
+            'actors': formatted_msg,
+            **selection
+        })
 
     @app.route('/actors/<int:actor_id>/movies')
     @requires_auth('get:actors')
+    @cached('actors', 'starring', 'casts', 'movies')
     def get_all_movies_with_actor(actor_id):
         """
-        Fetches all movies actor starred in
+        Fetches all movies actor starred in, as titles or as full movie
+        records when `full=true` is passed
 
         :param actor_id: actor id
         :type actor_id: int
         :return: jsonify object
         :rtype: jsonify
         """
-        movies_title = []
-        if not record_exist(Actors, actor_id):
+        full = request_flag('full')
+        movie_columns = Movies if full else Movies.title
+        rows = db.session.query(Actors.id, movie_columns).outerjoin(
+            Starring, Starring.actor_id == Actors.id).outerjoin(
+            Casts, Casts.id == Starring.cast_id).outerjoin(
+            Movies, Movies.id == Casts.movie_id).filter(
+            Actors.id == actor_id).order_by(Starring.id).all()
+        if not rows:
             abort(400, "Actor id does not exist")
-        starrings = db.session.query(Starring).filter(
-            Starring.actor_id == actor_id).all()
-        cast_ids = [star.cast_id for star in starrings]
-        for cast_id in cast_ids:
-            movie = db.session.query(Movies, Casts).join(Casts).filter(
-                Casts.id == cast_id).first()
-            movies_title.append(movie.Movies.title)
+
+        movies = [row[1] for row in rows if row[1] is not None]
+        if full:
+            movies = [movie.format() for movie in movies]
 
         return jsonify({
             'success': True,
-            'movies': movies_title
+            'movies': movies
         })
 
     @app.route('/movies')
     @requires_auth('get:movies')
+    @cached('movies')
     def get_movies():
         """
-        Fectch all movies
+        Fectch a page of movies or the records listed in the `ids` argument,
+        see `select_rows`
 
         :return: jsonify object
         :rtype: jsonify
         """
-        movies = db.session.query(Movies).all()
-        formatted_msg = [movie.format() for movie in movies]
-        return jsonify({
+        movies, selection = select_rows(column_query(Movies), Movies.id)
+        formatted_msg = [Movies.format_row(movie) for movie in movies]
+        return json_response({
             'success': True,
-            'movies': formatted_msg
-        }), 200
+            'movies': formatted_msg,
+            **selection
+        })
 
     @app.route('/movies/<int:movies_id>')
     @requires_auth('get:movies')
+    @cached('movies')
     def get_movies_by_id(movies_id):
         """
         Fetch movies by id
@@ -140,59 +296,63 @@ def create_app(test_config=None):
 
     @app.route('/movies/<int:movie_id>/cast')
     @requires_auth('get:movies')
+    @cached('movies', 'casts', 'starring', 'actors')
     def get_movie_casts(movie_id):
         """
-        Fetch all the cast for a movie specified by movie id
+        Fetch all the cast for a movie specified by movie id, as actor names
+        or as full actor records when `full=true` is passed
 
         :param movies_id: movie id
         :type movies_id: int
         :return: jsonify object
         :rtype: jsonify
         """
-        if not record_exist(Movies, movie_id):
+        full = request_flag('full')
+        actor_columns = Actors if full else Actors.name
+        rows = db.session.query(Movies.title, Casts.id,
+                                actor_columns).outerjoin(
+            Casts, Casts.movie_id == Movies.id).outerjoin(
+            Starring, Starring.cast_id == Casts.id).outerjoin(
+            Actors, Actors.id == Starring.actor_id).filter(
+            Movies.id == movie_id).order_by(Starring.id).all()
+        if not rows:
             abort(400, "Movie id does not exist")
-
-        cast = db.session.query(Casts).filter(
-            Casts.movie_id == movie_id).first()
-        if cast is None:
+        movie_title, cast_id = rows[0][0], rows[0][1]
+        if cast_id is None:
             return abort(404)
-        cast_id = cast.id
-
-        movie = db.session.query(Movies).get(movie_id)
-        movie_title = movie.title
 
-        stars = db.session.query(Starring, Casts).join(Casts).filter(
-            Casts.movie_id == movie_id).filter(Starring.cast_id ==
-                                               cast_id).all()
-        actor_names = []
-        for star in stars:
-            actor = db.session.query(Actors).get(star.Starring.actor_id)
-            actor_names.append(actor.name)
+        actors = [row[2] for row in rows if row[2] is not None]
+        if full:
+            actors = [actor.format() for actor in actors]
 
         return jsonify({
             'success': True,
             'movie': movie_title,
-            'casts': actor_names
+            'casts': actors
         }), 200
 
     @app.route('/casts')
     @requires_auth('get:casts')
+    @cached('casts')
     def get_casts():
         """
-        Fectch all casts
+        Fectch a page of casts or the records listed in the `ids` argument, see
+        `select_rows`
 
         :return: jsonify object
         :rtype: jsonify
         """
-        casts = db.session.query(Casts).all()
-        formatted_msg = [cast.format() for cast in casts]
-        return jsonify({
+        casts, selection = select_rows(column_query(Casts), Casts.id)
+        formatted_msg = [Casts.format_row(cast) for cast in casts]
+        return json_response({
             'success': True,
-            'casts': formatted_msg
-        }), 200
+            'casts': formatted_msg,
+            **selection
+        })
 
     @app.route('/casts/<int:cast_id>')
     @requires_auth('get:casts')
+    @cached('casts')
     def get_casts_by_id(cast_id):
         """
         Fetch cast by id
@@ -213,23 +373,27 @@ def create_app(test_config=None):
 
     @app.route('/stars')
     @requires_auth('get:stars')
+    @cached('starring')
     def get_starring():
         """
-        Fetch all actor assignment to cast
-
+        Fetch a page of actor assignment to cast or the records listed in the
+        `ids` argument, see `select_rows`
 
         :return: jsonify object
         :rtype: jsonify
         """
-        starrings = db.session.query(Starring).all()
-        formatted_msg = [star.format() for star in starrings]
-        return jsonify({
+        starrings, selection = select_rows(column_query(Starring),
+                                           Starring.id)
+        formatted_msg = [Starring.format_row(star) for star in starrings]
+        return json_response({
             'success': True,
-            'stars': formatted_msg
-        }), 200
+            'stars': formatted_msg,
+            **selection
+        })
 
     @app.route('/stars/<int:starring_id>')
     @requires_auth('get:stars')
+    @cached('starring')
     def get_starring_by_id(starring_id):
         """
         Fectch actor assignment to cast by id
@@ -248,6 +412,26 @@ def create_app(test_config=None):
             'star': formatted_msg
         }), 200
 
+    def export_view(model, key):
+        def export():
+            """
+            Streams every record of the table, ordered by id
+
+            :return: streamed ndjson or json response
+            :rtype: Response
+            """
+            return export_response(
+                column_query(model).order_by(model.id), key, model.format_row,
+                export_format=request.args.get('format', 'ndjson'),
+                batch_size=app.config['EXPORT_BATCH_SIZE'])
+        return export
+
+    for export_key, export_model in (('actors', Actors), ('movies', Movies),
+                                     ('casts', Casts), ('stars', Starring)):
+        app.add_url_rule('/export/' + export_key, 'export_' + export_key,
+                         requires_auth('get:' + export_key)(
+                             export_view(export_model, export_key)))
+
     @app.route('/movies', methods=['POST'])
     @requires_auth('post:movies')
     def create_movie():
@@ -257,19 +441,7 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        request_body = request.json
-        try:
-            release_date = request_body.get('release_date')
-            date_parts = release_date.split("/")
-            release_date = datetime(int(date_parts[0]), int(date_parts[1]),
-                                    int(date_parts[2]))
-        except:
-            return abort(400, "Error in release date field format")
-        movie = Movies(
-            title=request_body.get('title'),
-            description=request_body.get('description'),
-            release_date=release_date
-        )
+        movie = Movies(**validate_or_abort(movie_fields))
         db.session.add(movie)
         db.session.commit()
         return jsonify({
@@ -285,18 +457,9 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        request_body = request.json
-        movie_id = request_body.get('movie_id')
-        if not record_exist(Movies, movie_id):
-            return abort(400,
-                         "Movie id is invalid, please enter a valid Movie id")
-        cast = Casts(movie_id=movie_id)
+        cast = Casts(**validate_or_abort(cast_fields))
         db.session.add(cast)
-        try:
-            db.session.commit()
-        except IntegrityError:
-            return abort(400, "Duplicate key Violation, Movie id {} already "
-                              "assigned to a cast".format(movie_id))
+        commit_or_abort(cast_violations(cast.movie_id))
         return jsonify({
             'success': True
         }), 201
@@ -310,26 +473,7 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        try:
-            age = request.json.get('age')
-            age = int(age)
-            gender = str(request.json.get('gender'))
-            if gender != 'male' and gender != 'female':
-                raise NameError
-            if age <= 0:
-                raise ValueError
-        except ValueError:
-            abort(400, "Invalid value '{}' for Int() age field".format(age))
-        except NameError:
-            abort(400, "Invalid value '{}' for gender, acceptable values are "
-                       "male/female".format(gender))
-
-        actor = Actors(
-            name=request.json.get('name'),
-            age=age,
-            gender=gender,
-            nationality=request.json.get('nationality')
-        )
+        actor = Actors(**validate_or_abort(actor_fields))
         db.session.add(actor)
         db.session.commit()
 
@@ -346,29 +490,94 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        cast_id = request.json.get('cast_id')
-        actor_id = request.json.get('actor_id')
-        if not record_exist(Casts, cast_id):
-            return abort(400, "Cast id does not exist")
-        if not record_exist(Actors, actor_id):
-            return abort(400, "Actor id does not exist")
-
-        star = db.session.query(Starring).filter(Starring.cast_id == cast_id)\
-            .filter(Starring.actor_id == actor_id).all()
-        if star:
-            return abort(400, "Actor is already assigned to Cast")
-
-        star = Starring(
-            cast_id=cast_id,
-            actor_id=actor_id
-        )
+        star = Starring(**validate_or_abort(star_fields))
         db.session.add(star)
-        db.session.commit()
+        commit_or_abort(STARRING_VIOLATIONS)
 
         return jsonify({
             'success': True
         }), 201
 
+    @app.route('/movies/bulk', methods=['POST'])
+    @requires_auth('post:movies')
+    def create_movies_bulk():
+        """
+        Create movie records from a json array, see `bulk_response`
+
+        :return: jsonify object
+        :rtype: jsonify
+        """
+        items, rows, errors = validate_items(movie_fields)
+        ids = insert_rows(Movies, rows)
+        return bulk_response(items, rows, ids, errors)
+
+    @app.route('/actors/bulk', methods=['POST'])
+    @requires_auth('post:actors')
+    def create_actors_bulk():
+        """
+        Create actor records from a json array, see `bulk_response`
+
+        :return: jsonify object
+        :rtype: jsonify
+        """
+        items, rows, errors = validate_items(actor_fields)
+        ids = insert_rows(Actors, rows)
+        return bulk_response(items, rows, ids, errors)
+
+    @app.route('/casts/bulk', methods=['POST'])
+    @requires_auth('post:casts')
+    def create_casts_bulk():
+        """
+        Create cast records from a json array, see `bulk_response`
+
+        :return: jsonify object
+        :rtype: jsonify
+        """
+        items, rows, errors = validate_items(cast_fields)
+        movie_ids = existing_ids(Movies, [values['movie_id']
+                                          for index, values in rows])
+
+        def invalid(values):
+            if values['movie_id'] not in movie_ids:
+                return "Movie id is invalid, please enter a valid Movie id"
+
+        def duplicate(values):
+            return cast_violations(values['movie_id'])['casts_movie_id_key']
+
+        rows = reject_rows(rows, errors, invalid)
+        ids = insert_rows(Casts, rows, ('movie_id',), cast_violations(None))
+        return bulk_response(items, rows, ids, errors, duplicate)
+
+    @app.route('/stars/bulk', methods=['POST'])
+    @requires_auth('post:stars')
+    def assign_actors_bulk():
+        """
+        Create actor assignments to casts from a json array, see
+        `bulk_response`
+
+        :return: jsonify object
+        :rtype: jsonify
+        """
+        items, rows, errors = validate_items(star_fields)
+        cast_ids = existing_ids(Casts, [values['cast_id']
+                                        for index, values in rows])
+        actor_ids = existing_ids(Actors, [values['actor_id']
+                                          for index, values in rows])
+
+        def invalid(values):
+            if values['cast_id'] not in cast_ids:
+                return "Cast id does not exist"
+            if values['actor_id'] not in actor_ids:
+                return "Actor id does not exist"
+
+        def duplicate(values):
+            return "Actor is already assigned to Cast"
+
+        rows = reject_rows(rows, errors, invalid)
+        ids = insert_rows(Starring, rows, ('cast_id', 'actor_id'),
+                          STARRING_VIOLATIONS)
+        return bulk_response(items, rows, ids, errors, duplicate)
+
     @app.route('/movies/<int:movie_id>', methods=['DELETE'])
     @requires_auth('delete:movies')
     def delete_movie(movie_id):
@@ -380,11 +589,8 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        if not record_exist(Movies, movie_id):
+        if not delete_record(Movies, movie_id):
             return abort(400, "Movie id does not exist")
-        movie = db.session.query(Movies).get(movie_id)
-        db.session.delete(movie)
-        db.session.commit()
         return '', 204
 
     @app.route('/actors/<int:actor_id>', methods=['DELETE'])
@@ -398,11 +604,8 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        if not record_exist(Actors, actor_id):
+        if not delete_record(Actors, actor_id):
             return abort(400, "Actor id does not exist")
-        actor = db.session.query(Actors).get(actor_id)
-        db.session.delete(actor)
-        db.session.commit()
         return '', 204
 
     @app.route('/casts/<int:cast_id>', methods=['DELETE'])
@@ -416,11 +619,8 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        if not record_exist(Casts, cast_id):
+        if not delete_record(Casts, cast_id):
             return abort(400, "Cast id does not exist")
-        cast = db.session.query(Casts).get(cast_id)
-        db.session.delete(cast)
-        db.session.commit()
         return '', 204
 
     @app.route('/stars/<int:star_id>', methods=['DELETE'])
@@ -434,45 +634,23 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        if not record_exist(Starring, star_id):
+        if not delete_record(Starring, star_id):
             return abort(400, "Star id does not exist")
-        star = db.session.query(Starring).get(star_id)
-        db.session.delete(star)
-        db.session.commit()
         return '', 204
 
     @app.route('/actors/<actor_id>', methods=['PATCH'])
     @requires_auth('patch:actors')
     def update_actors(actor_id):
         """
-        Update actor record
+        Update the actor fields present in the request body
 
         :param actor_id: actor id
         :type actor_id: int
         :return: jsonify object
         :rtype: jsonify
         """
-        if not record_exist(Actors, actor_id):
-            return abort(400, "Actor id does not exist")
-        actor = db.session.query(Actors).get(actor_id)
-        try:
-            age = request.json.get('age')
-            age = int(age)
-            gender = str(request.json.get('gender'))
-            if gender != 'male' and gender != 'female':
-                raise NameError
-        except ValueError:
-            abort(400, "Invalid value '{}' for Int() age field".format(age))
-        except NameError:
-            abort(400, "Invalid value '{}' for gender, acceptable values are "
-                       "male/female".format(gender))
-
-        actor.name = request.json.get('name')
-        actor.age = age
-        actor.gender = gender
-        actor.nationality = request.json.get('nationality')
-
-        db.session.commit()
+        values = validate_or_abort(actor_updates)
+        update_record(Actors, actor_id, values, "Actor id does not exist")
 
         return jsonify({
             'success': True
@@ -482,30 +660,15 @@ def create_app(test_config=None):
     @requires_auth('patch:movies')
     def update_movie(movie_id):
         """
-        Update movie record
+        Update the movie fields present in the request body
 
         :param movie_id: movie id
         :type movie_id: int
         :return: jsonify object
         :rtype: jsonify
         """
-        request_body = request.json
-        if not record_exist(Movies, movie_id):
-            return abort(400, "Movie id does not exist")
-        try:
-            release_date = request_body.get('release_date')
-            date_parts = release_date.split("/")
-            release_date = datetime(int(date_parts[0]), int(date_parts[1]),
-                                    int(date_parts[2]))
-        except:
-            return abort(400, "Error in release date field format")
-
-        movie = db.session.query(Movies).get(movie_id)
-        movie.title = request_body.get('title'),
-        movie.description = request_body.get('description'),
-        movie.release_date = release_date
-
-        db.session.commit()
+        values = validate_or_abort(movie_updates)
+        update_record(Movies, movie_id, values, "Movie id does not exist")
 
         return jsonify({
             'success': True
@@ -522,18 +685,12 @@ def create_app(test_config=None):
         :return: jsonify object
         :rtype: jsonify
         """
-        request_body = request.json
-        movie_id = request_body.get('movie_id')
-        if not record_exist(Movies, movie_id):
+        movie_id = parse_id(body_fields('movie_id').get('movie_id'))
+        if movie_id is None:
             return abort(400,
                          "Movie id is invalid, please enter a valid Movie id")
-        cast = db.session.query(Casts).get(cast_id)
-        cast.movie_id = movie_id
-        try:
-            db.session.commit()
-        except IntegrityError:
-            return abort(400, "Duplicate key Violation, Movie id {} already "
-                              "assigned to a cast".format(movie_id))
+        update_record(Casts, cast_id, {'movie_id': movie_id},
+                      "Cast id does not exist", cast_violations(movie_id))
         return jsonify({
             'success': True
         }), 200
@@ -542,28 +699,25 @@ def create_app(test_config=None):
     @requires_auth('patch:stars')
     def update_stars(star_id):
         """
-        Update star record
+        Update the star fields present in the request body
 
         :param star_id: star id
         :type star_id: int
         :return: jsonify object
         :rtype: jsonify
         """
-        cast_id = request.json.get('cast_id')
-        actor_id = request.json.get('actor')
-        if not record_exist(Casts, cast_id):
-            return abort(400, "Cast id does not exist")
-        if not record_exist(Actors, actor_id):
-            return abort(400, "Actor id does not exist")
-        star = db.session.query(Starring).filter(Starring.cast_id == cast_id) \
-            .filter(Starring.actor_id == actor_id)
-        if star:
-            return abort(400, "Actor is already assigned to Cast")
+        values = body_fields('cast_id', 'actor_id')
+        if 'cast_id' in values:
+            values['cast_id'] = parse_id(values['cast_id'])
+            if values['cast_id'] is None:
+                return abort(400, "Cast id does not exist")
+        if 'actor_id' in values:
+            values['actor_id'] = parse_id(values['actor_id'])
+            if values['actor_id'] is None:
+                return abort(400, "Actor id does not exist")
 
-        star = db.session.query(Starring).get(star_id)
-        star.cast_id = cast_id,
-        star.actor_id = actor_id
-        db.session.commit()
+        update_record(Starring, star_id, values, "Star id does not exist",
+                      STARRING_VIOLATIONS)
 
         return jsonify({
             'success': True
@@ -621,8 +775,227 @@ def create_app(test_config=None):
             "message": message.get('description')
         }), status_code
 
-    def record_exist(db_table, record_id):
-        return db.session.query(db_table).get(record_id) is not None
+    def update_record(db_table, record_id, values, message, violations=None):
+        """
+        Updates the given columns of a record with a single
+        UPDATE ... RETURNING statement, aborting with the 400 message when no
+        record matched record_id
+
+        :param db_table: model to update
+        :type db_table: db.Model
+        :param record_id: record id
+        :type record_id: int
+        :param values: new value by column name
+        :type values: dict
+        :param message: error message
+        :type message: str
+        :param violations: error message by constraint name
+        :type violations: dict
+        """
+        record_id = parse_id(record_id)
+        if record_id is None:
+            abort(400, message)
+        if not values:
+            abort(400, "No fields to update")
+        table = db_table.__table__
+        try:
+            updated = db.session.execute(table.update().where(
+                table.c.id == record_id).values(values).returning(
+                table.c.id)).first()
+            db.session.commit()
+        except IntegrityError as error:
+            abort_on_violation(error, violations or {})
+        if updated is None:
+            abort(400, message)
+
+    def delete_record(db_table, record_id):
+        """
+        Deletes a record with a single DELETE statement, its children are
+        removed by the ON DELETE CASCADE foreign keys
+
+        :return: False if no record matched record_id
+        :rtype: bool
+        """
+        deleted = db.session.query(db_table).filter(
+            db_table.id == record_id).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted > 0
+
+    def validate_or_abort(fields):
+        """
+        Validates the json body with fields, aborting with its 400 message
+        when the body is invalid
+
+        :param fields: validation function of `validation`
+        :type fields: callable
+        :return: column values
+        :rtype: dict
+        """
+        try:
+            return fields(request.json)
+        except ValidationError as error:
+            abort(400, str(error))
+
+    def validate_items(fields):
+        """
+        Validates every item of a json array body with fields
+
+        :param fields: validation function of `validation`
+        :type fields: callable
+        :return: the items, (index, column values) of the valid items and the
+            error message by index of the invalid ones
+        :rtype: tuple
+        """
+        items = request.json
+        if not isinstance(items, list) or not items:
+            abort(400, "Expected a non-empty json array")
+        if len(items) > app.config['MAX_BULK_SIZE']:
+            abort(400, "At most {} items can be created at once".format(
+                app.config['MAX_BULK_SIZE']))
+        rows, errors = [], {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors[index] = "Expected a json object"
+                continue
+            try:
+                rows.append((index, fields(item)))
+            except ValidationError as error:
+                errors[index] = str(error)
+        return items, rows, errors
+
+    def reject_rows(rows, errors, invalid):
+        """
+        Moves the rows for which invalid returns a message to errors
+
+        :return: the remaining rows
+        :rtype: list
+        """
+        remaining = []
+        for index, values in rows:
+            message = invalid(values)
+            if message:
+                errors[index] = message
+            else:
+                remaining.append((index, values))
+        return remaining
+
+    def existing_ids(db_table, record_ids):
+        """
+        Returns the subset of record_ids that reference a row, in one query
+        """
+        if not record_ids:
+            return set()
+        return {record_id for record_id, in db.session.query(
+            db_table.id).filter(db_table.id.in_(set(record_ids)))}
+
+    def insert_rows(db_table, rows, conflict_columns=(), violations=None):
+        """
+        Inserts the rows with a single multi-row INSERT ... RETURNING and
+        commits. Rows that would violate the unique conflict_columns, or
+        repeat an earlier row of the batch on them, are skipped. The ids are
+        matched to the rows on the returned column values.
+
+        :param db_table: model to insert
+        :type db_table: db.Model
+        :param rows: (index, column values) of the rows
+        :type rows: list
+        :param conflict_columns: columns of a unique constraint
+        :type conflict_columns: tuple
+        :param violations: error message by foreign key name
+        :type violations: dict
+        :return: id of every row, None for the skipped rows
+        :rtype: list
+        """
+        if not rows:
+            return []
+        table = db_table.__table__
+        statement = insert(table).values([values for index, values in rows])
+        if conflict_columns:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=conflict_columns)
+        # neither the ids nor the RETURNING rows follow the VALUES order,
+        # rows are matched to their ids on the values they were inserted with
+        columns = list(conflict_columns or rows[0][1])
+        try:
+            inserted = db.session.execute(statement.returning(
+                table.c.id, *[table.c[column] for column in columns]
+            )).fetchall()
+            db.session.commit()
+        except IntegrityError as error:
+            # a referenced row was deleted after existing_ids
+            abort_on_violation(error, violations or {})
+        ids = {}
+        for row in inserted:
+            ids.setdefault(tuple(row[1:]), []).append(row[0])
+        created = []
+        for index, values in rows:
+            # identical rows are interchangeable, a skipped row has no id
+            matching = ids.get(tuple(values[column] for column in columns))
+            created.append(matching.pop(0) if matching else None)
+        return created
+
+    def bulk_response(items, rows, ids, errors, duplicate=None):
+        """
+        Reports the outcome of a bulk create: `ids` holds the id created for
+        each item of the request, null for the items listed in `errors`.
+        Responds 201 when at least one record was created, 400 otherwise.
+
+        :param duplicate: error message of a row skipped by `insert_rows`
+        :type duplicate: callable
+        :return: jsonify object
+        :rtype: jsonify
+        """
+        created = [None] * len(items)
+        for (index, values), record_id in zip(rows, ids):
+            if record_id is None:
+                errors[index] = duplicate(values)
+            created[index] = record_id
+        return jsonify({
+            'success': not errors,
+            'ids': created,
+            'errors': [{'index': index, 'message': errors[index]}
+                       for index in sorted(errors)]
+        }), 201 if any(created) else 400
+
+    def commit_or_abort(violations):
+        """
+        Commits the session, a violation of one of the constraints in
+        violations rolls back and aborts with its 400 message
+
+        :param violations: error message by constraint name
+        :type violations: dict
+        """
+        try:
+            db.session.commit()
+        except IntegrityError as error:
+            abort_on_violation(error, violations)
+
+    def abort_on_violation(error, violations):
+        """
+        Rolls back the session and aborts with the 400 message of the
+        violated constraint, errors not listed in violations are re-raised
+
+        :param error: error raised on flush or commit
+        :type error: IntegrityError
+        :param violations: error message by constraint name
+        :type violations: dict
+        """
+        db.session.rollback()
+        message = violations.get(violated_constraint(error))
+        if message is None:
+            raise error
+        abort(400, message)
+
+    def request_flag(name):
+        return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+    def body_fields(*names):
+        """
+        Returns the fields of the json body among names, keyed by name
+        """
+        request_body = request.json or {}
+        return {name: request_body[name] for name in names
+                if name in request_body}
 
     return app
 
@@ -1,14 +1,51 @@
-import json
+import logging
 import os
-from flask import request, abort
+from flask import g, request, abort
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+from logging.handlers import MemoryHandler
+
+from auth.jwks import JWKSKeyStore
+from auth.token_cache import TokenCache
+from instrumentation import timed
 
 
 AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
 ALGORITHMS = ['RS256']
 API_AUDIENCE = os.environ['API_AUDIENCE']
+JWKS_URL = os.environ.get('AUTH0_JWKS_URL',
+                          f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 600))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+AUTH_LOG_LEVEL = os.environ.get('AUTH_LOG_LEVEL', 'WARNING').upper()
+AUTH_LOG_BUFFER = int(os.environ.get('AUTH_LOG_BUFFER', 256))
+
+jwks_store = JWKSKeyStore(JWKS_URL, ttl=JWKS_CACHE_TTL)
+token_cache = TokenCache(max_entries=TOKEN_CACHE_SIZE)
+
+
+def setup_logger():
+    """
+    Configures the `auth` logger. Records below AUTH_LOG_LEVEL are dropped
+    before formatting, the rest are buffered and written to stderr once
+    AUTH_LOG_BUFFER records are queued or a warning is logged. Handlers
+    configured by the application are left untouched.
+    """
+    auth_logger = logging.getLogger('auth')
+    auth_logger.setLevel(AUTH_LOG_LEVEL)
+    if not auth_logger.handlers:
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'))
+        auth_logger.addHandler(MemoryHandler(AUTH_LOG_BUFFER,
+                                             flushLevel=logging.WARNING,
+                                             target=stream))
+        auth_logger.propagate = False
+    return auth_logger
+
+
+setup_logger()
+logger = logging.getLogger(__name__)
 
 
 class AuthError(Exception):
@@ -48,49 +85,59 @@ def get_token_auth_header():
         }, 401)
 
     token = parts[1]
-    print("Token was retrieved successfully")
+    logger.debug("Token was retrieved successfully")
     return token
 
 
-def check_permission(permission, payload):
-    if 'permissions' not in payload:
+def check_permission(permission, permissions):
+    """
+    Aborts with 403 unless permission is in the token's permission set
+
+    :param permission: required permission
+    :type permission: str
+    :param permissions: permissions claim, None if the token has none
+    :type permissions: frozenset
+    """
+    if permissions is None:
         abort(403)
-    if permission not in payload['permissions']:
+    if permission not in permissions:
         abort(403)
-    print("************successfully checked permission")
+    logger.debug("Successfully checked permission %s", permission)
     return True
 
 
+def verify_token(token):
+    """
+    Returns the verified payload and permission set for token, decoding it
+    only when it is not already in the token cache
+    """
+    verified = token_cache.get(token)
+    if verified is None:
+        verified = token_cache.set(token, verify_decode_jwt(token))
+    return verified
+
+
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    with timed('jwks'):
+        rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
-            print("*************payload was retrieved successfully")
+            with timed('jwt'):
+                payload = jwt.decode(
+                    token,
+                    rsa_key,
+                    algorithms=ALGORITHMS,
+                    audience=API_AUDIENCE,
+                    issuer='https://' + AUTH0_DOMAIN + '/'
+                )
+            logger.debug("Payload was retrieved successfully")
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -121,15 +168,18 @@ def requires_auth(permission=''):
     def require_auth_decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            try:
-                payload = verify_decode_jwt(token)
-            except:
-                abort(401)
-
-            check_permission(permission, payload)
-
-            return func(*args, **kwargs)
+            with timed('auth'):
+                token = get_token_auth_header()
+                try:
+                    verified = verify_token(token)
+                except:
+                    abort(401)
+
+                check_permission(permission, verified.permissions)
+                g.permissions = verified.permissions
+
+            with timed('view'):
+                return func(*args, **kwargs)
 
         return wrapper
 
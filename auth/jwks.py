@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSKeyStore:
+    """
+    In-process cache of the JSON Web Key Set published by the identity
+    provider, keyed by `kid`.
+
+    The key set is fetched on first use and then served from memory. Once the
+    TTL has elapsed the cached keys keep being served while a single
+    background thread fetches a fresh copy. An unknown `kid` forces one
+    synchronous refresh (the provider may have rotated its keys), rate
+    limited by `min_refresh_interval`. Concurrent refreshes are coalesced so
+    a worker never fetches the document more than once at the same moment.
+
+    :param url: JWKS document url, any scheme urlopen supports (https, file)
+    :type url: str
+    :param ttl: seconds before the cached key set is refreshed
+    :type ttl: int
+    :param min_refresh_interval: minimum seconds between forced refreshes
+    :type min_refresh_interval: int
+    :param timeout: fetch timeout in seconds
+    :type timeout: int
+    """
+
+    def __init__(self, url, ttl=600, min_refresh_interval=30, timeout=5):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.fetch_count = 0
+        self.hits = 0
+        self.misses = 0
+        self._keys = {}
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._expires_at = 0.0
+        self._generation = 0
+        self._fetch_lock = threading.Lock()
+        self._background_lock = threading.Lock()
+
+    def get_key(self, kid):
+        """
+        Returns the rsa key for kid, or None if the provider does not
+        publish it
+
+        :param kid: key id from the token header
+        :type kid: str
+        :return: rsa key
+        :rtype: dict
+        """
+        generation = self._generation
+        fetched = False
+        if not self._loaded:
+            self.refresh(generation)
+            fetched = True
+        elif time.monotonic() >= self._expires_at:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and self._generation == generation and \
+                time.monotonic() - self._loaded_at >= \
+                self.min_refresh_interval:
+            self.refresh(generation)
+            fetched = True
+            key = self._keys.get(kid)
+        # a lookup that had to wait for a fetch is a miss
+        if fetched:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key
+
+    def refresh(self, generation=None):
+        """
+        Fetches the key set, unless another thread already refreshed it
+        since `generation` was observed
+
+        :param generation: key set generation seen by the caller
+        :type generation: int
+        """
+        with self._fetch_lock:
+            if generation is not None and generation != self._generation:
+                return
+            keys = self._fetch()
+            now = time.monotonic()
+            self._keys = keys
+            self._loaded_at = now
+            self._expires_at = now + self.ttl
+            self._loaded = True
+            self._generation += 1
+
+    def clear(self):
+        with self._fetch_lock:
+            self._keys = {}
+            self._loaded = False
+            self._generation += 1
+
+    def _fetch(self):
+        self.fetch_count += 1
+        with urlopen(self.url, timeout=self.timeout) as response:
+            jwks = json.loads(response.read())
+        keys = {}
+        for key in jwks['keys']:
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+        return keys
+
+    def _refresh_in_background(self):
+        if not self._background_lock.acquire(blocking=False):
+            return
+        thread = threading.Thread(target=self._background_refresh,
+                                  args=(self._generation,), daemon=True)
+        try:
+            thread.start()
+        except Exception:
+            self._background_lock.release()
+            raise
+
+    def _background_refresh(self, generation):
+        try:
+            self.refresh(generation)
+        except Exception:
+            logger.warning("JWKS refresh from %s failed, serving cached keys",
+                           self.url, exc_info=True)
+            self._expires_at = time.monotonic() + self.min_refresh_interval
+        finally:
+            self._background_lock.release()
@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+VerifiedToken = namedtuple('VerifiedToken', ['payload', 'permissions'])
+
+
+def build_verified_token(payload):
+    """
+    Pairs a verified payload with its permissions claim as a frozenset, or
+    None when the claim is missing
+    """
+    permissions = payload.get('permissions')
+    if permissions is not None:
+        permissions = frozenset(permissions)
+    return VerifiedToken(payload, permissions)
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens.
+
+    Entries are keyed by the sha256 digest of the raw token, so bearer
+    tokens are never held in memory, and expire at the token's `exp`
+    claim. Tokens without an `exp` claim are not cached. Memory per worker
+    is capped by `max_entries`, the least recently used entry is evicted
+    first.
+
+    :param max_entries: maximum number of cached tokens, 0 disables caching
+    :type max_entries: int
+    :param clock: returns the current unix time
+    :type clock: callable
+    """
+
+    def __init__(self, max_entries=1024, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token):
+        """
+        Returns the cached verified token, or None on a miss
+
+        :param token: raw bearer token
+        :type token: str
+        :return: verified payload and permission set
+        :rtype: VerifiedToken
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, verified = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verified
+
+    def set(self, token, payload):
+        """
+        Caches a verified payload until the token expires
+
+        :param token: raw bearer token
+        :type token: str
+        :param payload: verified payload
+        :type payload: dict
+        :return: verified payload and permission set
+        :rtype: VerifiedToken
+        """
+        verified = build_verified_token(payload)
+        expires_at = payload.get('exp')
+        if not self.max_entries or not isinstance(expires_at, (int, float)):
+            return verified
+        if self.clock() >= expires_at:
+            return verified
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, verified)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return verified
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'max_entries': self.max_entries
+        }
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
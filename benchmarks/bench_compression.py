@@ -0,0 +1,65 @@
+"""
+Compares the CPU cost and the bytes saved by compressing list endpoint
+payloads at several gzip levels and, when the brotli package is installed,
+brotli qualities.
+
+The payloads are built from synthetic rows, no database is needed:
+
+    python benchmarks/bench_compression.py --rows 10000
+
+Prints a json report with, for every payload and level, the compression
+time and the compressed size relative to the encoded json.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from bench_json import payloads  # noqa: E402
+from compression import brotli, compress  # noqa: E402
+from json_encoding import stdlib_dumps  # noqa: E402
+
+
+LEVELS = {
+    'gzip': [1, 3, 6, 9],
+    'br': [1, 4, 6, 9, 11]
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    report = []
+    for key, rows in payloads(args.rows).items():
+        data = stdlib_dumps({'success': True, key: rows,
+                             'next_cursor': None}, sort_keys=True)
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                compressed = compress(data, encoding, level)
+                seconds = min(timeit.repeat(
+                    lambda: compress(data, encoding, level), number=1,
+                    repeat=args.repeat))
+                report.append({
+                    'payload': key,
+                    'encoding': encoding,
+                    'level': level,
+                    'bytes': len(data),
+                    'compressed_bytes': len(compressed),
+                    'ratio': round(len(data) / len(compressed), 1),
+                    'ms': round(seconds * 1000, 2),
+                    'mb_per_s': round(len(data) / seconds / 1e6, 1)
+                })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Compares postgres plan cost of the hot lookup queries with and without the
+secondary indexes declared in model.py.
+
+Each "before" plan is taken inside a transaction that drops the index and is
+rolled back, so the schema is left untouched. Dropping holds an exclusive
+lock on the table until the rollback: run this against a scratch database,
+never production.
+
+    DATABASE_URL=postgresql://localhost:5432/capstone_bench \\
+        python benchmarks/bench_indexes.py --seed --actors 100000
+
+Prints a json report with the plan cost (and with --analyze the execution
+time) of every query before and after.
+"""
+import argparse
+import json
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from model import db  # noqa: E402
+
+
+NATIONALITIES = 50
+
+QUERIES = [
+    {
+        'name': 'actors_by_nationality',
+        'index': 'ix_actors_nationality_id',
+        'drop': 'DROP INDEX ix_actors_nationality_id',
+        'sql': "SELECT * FROM actors WHERE nationality = 'Nationality 7' "
+               "AND id > 0 ORDER BY id LIMIT 101"
+    },
+    {
+        'name': 'movies_with_actor',
+        'index': 'ix_starring_actor_id',
+        'drop': 'DROP INDEX ix_starring_actor_id',
+        'sql': "SELECT actors.id, movies.title FROM actors "
+               "LEFT OUTER JOIN starring ON starring.actor_id = actors.id "
+               "LEFT OUTER JOIN casts ON casts.id = starring.cast_id "
+               "LEFT OUTER JOIN movies ON movies.id = casts.movie_id "
+               "WHERE actors.id = 42 ORDER BY starring.id"
+    },
+    {
+        'name': 'cast_of_movie',
+        'index': 'uq_starring_cast_id_actor_id',
+        'drop': 'ALTER TABLE starring DROP CONSTRAINT '
+                'uq_starring_cast_id_actor_id',
+        'sql': "SELECT movies.title, casts.id, actors.name FROM movies "
+               "LEFT OUTER JOIN casts ON casts.movie_id = movies.id "
+               "LEFT OUTER JOIN starring ON starring.cast_id = casts.id "
+               "LEFT OUTER JOIN actors ON actors.id = starring.actor_id "
+               "WHERE movies.id = 42 ORDER BY starring.id"
+    },
+]
+
+
+def seed(connection, actors, movies, stars):
+    connection.execute(text(
+        "TRUNCATE starring, casts, actors, movies RESTART IDENTITY"))
+    connection.execute(text(
+        "INSERT INTO actors (name, age, gender, nationality) "
+        "SELECT 'Actor ' || i, 20 + i % 60, "
+        "CASE WHEN i % 2 = 0 THEN 'male' ELSE 'female' END, "
+        "'Nationality ' || i % :nationalities "
+        "FROM generate_series(1, :actors) AS i"),
+        actors=actors, nationalities=NATIONALITIES)
+    connection.execute(text(
+        "INSERT INTO movies (title, description, release_date) "
+        "SELECT 'Movie ' || i, 'Description ' || i, "
+        "DATE '2000-01-01' + i % 7000 FROM generate_series(1, :movies) AS i"),
+        movies=movies)
+    connection.execute(text(
+        "INSERT INTO casts (movie_id) SELECT id FROM movies"))
+    connection.execute(text(
+        "INSERT INTO starring (cast_id, actor_id) "
+        "SELECT DISTINCT 1 + (i * 7919) % :movies, "
+        "1 + (i * 104729) % :actors "
+        "FROM generate_series(1, CAST(:stars AS bigint)) AS i"),
+        movies=movies, actors=actors, stars=stars)
+    connection.execute(text("ANALYZE"))
+
+
+def plan(connection, sql, analyze):
+    options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+    result = connection.execute(text(
+        'EXPLAIN ({}) {}'.format(options, sql))).scalar()
+    if isinstance(result, str):
+        result = json.loads(result)
+    top = result[0]
+    report = {
+        'total_cost': top['Plan']['Total Cost'],
+        'node': top['Plan']['Node Type']
+    }
+    if analyze:
+        report['execution_ms'] = top['Execution Time']
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', action='store_true',
+                        help='truncate the tables and load a dataset')
+    parser.add_argument('--actors', type=int, default=100000)
+    parser.add_argument('--movies', type=int, default=50000)
+    parser.add_argument('--stars', type=int, default=1000000)
+    parser.add_argument('--analyze', action='store_true',
+                        help='run EXPLAIN ANALYZE to report execution time')
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ['DATABASE_URL'])
+    db.metadata.create_all(engine)
+    if args.seed:
+        with engine.begin() as connection:
+            seed(connection, args.actors, args.movies, args.stars)
+
+    report = []
+    with engine.connect() as connection:
+        for query in QUERIES:
+            transaction = connection.begin()
+            try:
+                connection.execute(text(query['drop']))
+                before = plan(connection, query['sql'], args.analyze)
+            finally:
+                transaction.rollback()
+            after = plan(connection, query['sql'], args.analyze)
+            report.append({
+                'query': query['name'],
+                'index': query['index'],
+                'before': before,
+                'after': after
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Compares the time to encode list endpoint payloads with jsonify and with
+the stdlib and orjson backends of json_encoding.
+
+The payloads are built from synthetic rows, no database is needed:
+
+    python benchmarks/bench_json.py --rows 10000
+
+Prints a json report with the encode time of a --rows rows payload of every
+resource, per backend. orjson is skipped when it is not installed.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from collections import namedtuple
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask, jsonify  # noqa: E402
+
+from json_encoding import BACKENDS, init_json, orjson  # noqa: E402
+from model import Actors, Casts, Movies, Starring  # noqa: E402
+
+
+def payloads(rows):
+    actor = namedtuple('Actor', 'id name age gender nationality')
+    movie = namedtuple('Movie', 'id title release_date description')
+    cast = namedtuple('Cast', 'id movie_id')
+    star = namedtuple('Star', 'id cast_id actor_id')
+    start = date(2000, 1, 1)
+    return {
+        'actors': [Actors.format_row(actor(
+            i, 'Actor {}'.format(i), 20 + i % 60,
+            'male' if i % 2 else 'female', 'Nationality {}'.format(i % 50)))
+            for i in range(1, rows + 1)],
+        'movies': [Movies.format_row(movie(
+            i, 'Movie {}'.format(i), start + timedelta(days=i % 7000),
+            'Description of movie {}'.format(i)))
+            for i in range(1, rows + 1)],
+        'casts': [Casts.format_row(cast(i, i)) for i in range(1, rows + 1)],
+        'stars': [Starring.format_row(star(i, i, 1 + i * 7919 % rows))
+                  for i in range(1, rows + 1)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    init_json(app)
+    backends = ['stdlib'] + (['orjson'] if orjson else [])
+    report = []
+    with app.test_request_context():
+        for key, rows in payloads(args.rows).items():
+            payload = {'success': True, key: rows, 'next_cursor': None}
+            encoders = {'jsonify': lambda: jsonify(payload).get_data()}
+            for backend in backends:
+                encoders[backend] = (lambda dumps: lambda: dumps(
+                    payload, sort_keys=True))(BACKENDS[backend])
+            outputs = {name: json.loads(encode())
+                       for name, encode in encoders.items()}
+            assert all(output == outputs['jsonify']
+                       for output in outputs.values())
+            report.append({
+                'payload': key,
+                'rows': args.rows,
+                'ms': {name: round(min(timeit.repeat(
+                    encode, number=1, repeat=args.repeat)) * 1000, 2)
+                    for name, encode in encoders.items()}
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
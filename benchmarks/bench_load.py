@@ -0,0 +1,501 @@
+"""
+Load test: drives every route of app.py over HTTP at a fixed concurrency
+and reports the throughput, latency percentiles and query counts of each.
+
+Seeds a dataset of configurable size, truncating the tables, so run it
+against a scratch database. Tokens are minted locally, signed with a key
+pair generated for the run whose public key is served by a local JWKS
+stand-in, so neither Auth0 nor the tokens of jwt.py are needed:
+
+    DATABASE_URL=postgresql://localhost:5432/capstone_bench \\
+        python benchmarks/bench_load.py --actors 100000 --movies 50000 \\
+        --starring 1000000 --concurrency 8 --requests 500
+
+The app runs in a separate process, under gunicorn when it is installed
+and the werkzeug server otherwise, with the environment of this script,
+so settings such as RESPONSE_CACHE or JSON_BACKEND apply to it. The reads
+run first, then the creates, updates and deletes, each route on its own.
+POST /admin/profile is left out, it only arms the profiler.
+
+Prints a json report with, for every route, the requests per second, the
+p50/p95/p99 latency, the status codes and the queries per request read
+from the Server-Timing header, which can be diffed between commits.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+import rsa
+from flask import Flask
+from jose import jwt
+from sqlalchemy import text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from model import db, setup_db  # noqa: E402
+
+
+AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN', 'benchmark.local')
+API_AUDIENCE = os.environ.get('API_AUDIENCE', 'casting')
+KID = 'benchmark'
+
+PERMISSIONS = [
+    'get:actors', 'get:movies', 'get:casts', 'get:stars',
+    'post:actors', 'post:movies', 'post:casts', 'post:stars',
+    'patch:actors', 'patch:movies', 'patch:casts', 'patch:stars',
+    'delete:actors', 'delete:movies', 'delete:casts', 'delete:stars',
+    'get:slow-queries'
+]
+
+QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+WERKZEUG = ("import logging; from werkzeug.serving import run_simple; "
+            "from app import APP; "
+            "logging.getLogger('werkzeug').setLevel(logging.ERROR); "
+            "run_simple('127.0.0.1', {}, APP, threaded=True)")
+
+
+def seed(actors, movies, starring):
+    """
+    Loads actors, movies with a cast each and starring rows spread over
+    the casts. Ids are deterministic, the tables are truncated first.
+    """
+    db.session.execute(text(
+        "TRUNCATE starring, casts, actors, movies RESTART IDENTITY"))
+    db.session.execute(text(
+        "INSERT INTO actors (name, age, gender, nationality) "
+        "SELECT 'Actor ' || i, 20 + i % 60, "
+        "CASE WHEN i % 2 = 0 THEN 'male' ELSE 'female' END, "
+        "'Nationality ' || i % 50 FROM generate_series(1, :rows) AS i"),
+        {'rows': actors})
+    db.session.execute(text(
+        "INSERT INTO movies (title, description, release_date) "
+        "SELECT 'Movie ' || i, 'Description ' || i, "
+        "DATE '2000-01-01' + i % 7000 FROM generate_series(1, :rows) AS i"),
+        {'rows': movies})
+    db.session.execute(text(
+        "INSERT INTO casts (movie_id) SELECT id FROM movies ORDER BY id"))
+    # 104729 is prime, the actors of a cast are distinct
+    db.session.execute(text(
+        "INSERT INTO starring (cast_id, actor_id) "
+        "SELECT c, 1 + (c * 7919 + k * 104729) % :actors "
+        "FROM generate_series(1, :movies) AS c, "
+        "generate_series(0, :per_cast - 1) AS k "
+        "LIMIT :rows ON CONFLICT DO NOTHING"),
+        {'actors': actors, 'movies': movies, 'rows': starring,
+         'per_cast': max(1, math.ceil(starring / movies))})
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def table_sizes():
+    return {table: db.session.execute(text(
+        "SELECT count(*) FROM " + table)).scalar()
+        for table in ('actors', 'movies', 'casts', 'starring')}
+
+
+def spread(table, count):
+    """
+    Returns count ids of table visited with a prime stride, so successive
+    requests do not hit neighbouring rows
+    """
+    top = db.session.execute(text(
+        "SELECT max(id) FROM " + table)).scalar() or 1
+    return [1 + (i * 7919) % top for i in range(count)]
+
+
+def select_ids(query, count):
+    return [row[0] for row in db.session.execute(text(query + " LIMIT :n"),
+                                                 {'n': count})]
+
+
+def free_movies(count):
+    return select_ids("SELECT id FROM movies m WHERE NOT EXISTS ("
+                      "SELECT 1 FROM casts c WHERE c.movie_id = m.id) "
+                      "ORDER BY id", count)
+
+
+def unstarred_casts(count):
+    return select_ids("SELECT id FROM casts c WHERE NOT EXISTS ("
+                      "SELECT 1 FROM starring s WHERE s.cast_id = c.id) "
+                      "ORDER BY id", count)
+
+
+def star_bodies(count):
+    return [{'cast_id': cast_id, 'actor_id': actor_id}
+            for cast_id, actor_id in zip(unstarred_casts(count),
+                                         spread('actors', count))]
+
+
+def chunks(items, size):
+    return [items[start:start + size]
+            for start in range(0, len(items), size)]
+
+
+def movie_body(index):
+    return {'title': 'Load {}'.format(index), 'description': 'Load test',
+            'release_date': '2020/1/4'}
+
+
+def actor_body(index):
+    return {'name': 'Load {}'.format(index), 'age': 20 + index % 60,
+            'gender': 'male' if index % 2 else 'female',
+            'nationality': 'Nationality {}'.format(index % 50)}
+
+
+def page(table, path, count):
+    return [('{}?after={}'.format(path, record_id - 1), None)
+            for record_id in spread(table, count)]
+
+
+def by_id(table, path, count):
+    return [(path.format(record_id), None)
+            for record_id in spread(table, count)]
+
+
+def scenarios(args):
+    """
+    Returns the (method, route, build) of every route, in the order they
+    run. build returns the (path, body) of the requests to send, from the
+    current state of the database.
+    """
+    n, bulk = args.requests, args.bulk_size
+    reads = [
+        ('GET', '/actors', lambda: page('actors', '/actors', n)),
+        ('GET', '/actors/<id>', lambda: by_id('actors', '/actors/{}', n)),
+        ('GET', '/actors/nationality/<nationality>', lambda: [
+            ('/actors/nationality/Nationality {}'.format(i % 50), None)
+            for i in range(n)]),
+        ('GET', '/actors/<id>/movies',
+         lambda: by_id('actors', '/actors/{}/movies', n)),
+        ('GET', '/movies', lambda: page('movies', '/movies', n)),
+        ('GET', '/movies/<id>', lambda: by_id('movies', '/movies/{}', n)),
+        ('GET', '/movies/<id>/cast',
+         lambda: by_id('movies', '/movies/{}/cast', n)),
+        ('GET', '/casts', lambda: page('casts', '/casts', n)),
+        ('GET', '/casts/<id>', lambda: by_id('casts', '/casts/{}', n)),
+        ('GET', '/stars', lambda: page('starring', '/stars', n)),
+        ('GET', '/stars/<id>', lambda: by_id('starring', '/stars/{}', n)),
+        ('GET', '/metrics', lambda: [('/metrics', None)] * n),
+        ('GET', '/admin/slow-queries',
+         lambda: [('/admin/slow-queries', None)] * n)
+    ]
+    exports = [
+        ('GET', '/export/' + key, (lambda key: lambda: [
+            ('/export/' + key, None)] * args.export_requests)(key))
+        for key in ('actors', 'movies', 'casts', 'stars')
+    ]
+    creates = [
+        ('POST', '/movies', lambda: [
+            ('/movies', movie_body(i)) for i in range(n)]),
+        ('POST', '/movies/bulk', lambda: [
+            ('/movies/bulk', [movie_body(i * bulk + j) for j in range(bulk)])
+            for i in range(n)]),
+        ('POST', '/actors', lambda: [
+            ('/actors', actor_body(i)) for i in range(n)]),
+        ('POST', '/actors/bulk', lambda: [
+            ('/actors/bulk', [actor_body(i * bulk + j) for j in range(bulk)])
+            for i in range(n)]),
+        ('POST', '/casts', lambda: [
+            ('/casts', {'movie_id': movie_id})
+            for movie_id in free_movies(n)]),
+        ('POST', '/casts/bulk', lambda: [
+            ('/casts/bulk', [{'movie_id': movie_id} for movie_id in chunk])
+            for chunk in chunks(free_movies(n * bulk), bulk)]),
+        ('POST', '/stars', lambda: [
+            ('/stars', body) for body in star_bodies(n)]),
+        ('POST', '/stars/bulk', lambda: [
+            ('/stars/bulk', chunk)
+            for chunk in chunks(star_bodies(n * bulk), bulk)])
+    ]
+    updates = [
+        ('PATCH', '/actors/<id>', lambda: [
+            ('/actors/{}'.format(actor_id), {'age': 20 + i % 60})
+            for i, actor_id in enumerate(spread('actors', n))]),
+        ('PATCH', '/movies/<id>', lambda: [
+            ('/movies/{}'.format(movie_id), {'title': 'Patched {}'.format(i)})
+            for i, movie_id in enumerate(spread('movies', n))]),
+        ('PATCH', '/casts/<id>', lambda: [
+            ('/casts/{}'.format(cast_id), {'movie_id': movie_id})
+            for cast_id, movie_id in db.session.execute(text(
+                "SELECT id, movie_id FROM casts ORDER BY id LIMIT :n"),
+                {'n': n})]),
+        ('PATCH', '/stars/<id>', lambda: [
+            ('/stars/{}'.format(star_id), {'actor_id': actor_id})
+            for star_id, actor_id in db.session.execute(text(
+                "SELECT id, actor_id FROM starring ORDER BY id LIMIT :n"),
+                {'n': n})])
+    ]
+    deletes = [
+        ('DELETE', '/{}/<id>'.format(path), (lambda table, path: lambda: [
+            ('/{}/{}'.format(path, record_id), None)
+            for record_id in select_ids(
+                "SELECT id FROM {} ORDER BY id DESC".format(table), n)])(
+            table, path))
+        for table, path in (('starring', 'stars'), ('casts', 'casts'),
+                            ('actors', 'actors'), ('movies', 'movies'))
+    ]
+    return reads + exports + creates + updates + deletes
+
+
+def b64(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def generate_key():
+    """
+    Generates the signing key pair of the run
+
+    :return: private key in PEM format and the JWKS of its public key
+    :rtype: tuple
+    """
+    public, private = rsa.newkeys(2048)
+    jwks = {'keys': [{'kty': 'RSA', 'kid': KID, 'use': 'sig',
+                      'alg': 'RS256', 'n': b64(public.n),
+                      'e': b64(public.e)}]}
+    return private.save_pkcs1().decode('ascii'), jwks
+
+
+def serve_jwks(jwks):
+    """
+    Serves jwks over http on a free local port, in a background thread
+
+    :return: the server and the url of the document
+    :rtype: tuple
+    """
+    body = json.dumps(jwks).encode('utf-8')
+
+    class JWKSHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JWKSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/.well-known/jwks.json'.format(
+        server.server_port)
+
+
+def mint_tokens(pem, count):
+    """
+    Mints count distinct tokens carrying every permission, valid for a day
+    """
+    now = int(time.time())
+    return [jwt.encode({
+        'iss': 'https://{}/'.format(AUTH0_DOMAIN),
+        'aud': API_AUDIENCE,
+        'sub': 'benchmark|{}'.format(index),
+        'iat': now,
+        'exp': now + 86400,
+        'permissions': PERMISSIONS
+    }, pem, algorithm='RS256', headers={'kid': KID})
+        for index in range(count)]
+
+
+def start_server(args, jwks_url):
+    """
+    Starts the app in a subprocess and waits until it accepts connections
+
+    :return: the server process and its port
+    :rtype: tuple
+    """
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = dict(os.environ, AUTH0_DOMAIN=AUTH0_DOMAIN,
+               API_AUDIENCE=API_AUDIENCE, AUTH0_JWKS_URL=jwks_url)
+    if args.server == 'gunicorn':
+        command = ['gunicorn', '--workers', str(args.workers), '--bind',
+                   '127.0.0.1:{}'.format(port), 'app:APP']
+    else:
+        command = [sys.executable, '-c', WERKZEUG.format(port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while True:
+        if process.poll() is not None:
+            raise SystemExit("The {} server exited with status {}".format(
+                args.server, process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return process, port
+        except OSError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise SystemExit("The {} server did not start".format(
+                    args.server))
+            time.sleep(0.2)
+
+
+def drive(port, method, requests, tokens, concurrency):
+    """
+    Sends requests from concurrency threads, each over its own connection
+
+    :return: (status, seconds, queries) of every request and the elapsed
+        seconds
+    :rtype: tuple
+    """
+    local = threading.local()
+
+    def send(index):
+        path, body = requests[index]
+        headers = {'Authorization': 'Bearer ' + tokens[index % len(tokens)],
+                   'Accept-Encoding': 'gzip'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if getattr(local, 'connection', None) is None:
+            local.connection = HTTPConnection('127.0.0.1', port, timeout=60)
+        started = time.perf_counter()
+        try:
+            local.connection.request(method, quote(path, safe='/?=&,'), data,
+                                     headers)
+            response = local.connection.getresponse()
+            response.read()
+        except (HTTPException, OSError):
+            local.connection.close()
+            local.connection = None
+            return 'error', time.perf_counter() - started, None
+        seconds = time.perf_counter() - started
+        timing = response.getheader('Server-Timing')
+        queries = None
+        if timing is not None:
+            match = QUERIES.search(timing)
+            queries = int(match.group(1)) if match else 0
+        return response.status, seconds, queries
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(send, range(len(requests))))
+        return results, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted values
+    """
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(method, route, results, seconds, concurrency):
+    latencies = sorted(result[1] * 1000 for result in results)
+    queries = [result[2] for result in results if result[2] is not None]
+    return {
+        'method': method,
+        'route': route,
+        'requests': len(results),
+        'concurrency': concurrency,
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(results) / seconds, 1),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.5), 2),
+            'p95': round(percentile(latencies, 0.95), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(latencies[-1], 2)
+        },
+        'statuses': dict(sorted(Counter(
+            str(result[0]) for result in results).items())),
+        'queries': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries)
+        } if queries else None
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--actors', type=int, default=100000)
+    parser.add_argument('--movies', type=int, default=50000)
+    parser.add_argument('--starring', type=int, default=1000000)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='run against the current content of the tables')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests per route')
+    parser.add_argument('--export-requests', type=int, default=3,
+                        help='requests per export route')
+    parser.add_argument('--bulk-size', type=int, default=100,
+                        help='records per bulk request')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--tokens', type=int, default=10,
+                        help='distinct tokens the requests rotate through')
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'],
+                        default='gunicorn' if shutil.which('gunicorn')
+                        else 'werkzeug')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='gunicorn worker processes')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    setup_db(app, os.environ['DATABASE_URL'])
+    with app.app_context():
+        if not args.no_seed:
+            seed(args.actors, args.movies, args.starring)
+        dataset = table_sizes()
+        db.session.remove()
+
+    pem, jwks = generate_key()
+    jwks_server, jwks_url = serve_jwks(jwks)
+    tokens = mint_tokens(pem, args.tokens)
+    process, port = start_server(args, jwks_url)
+    routes = []
+    try:
+        with app.app_context():
+            for method, route, build in scenarios(args):
+                requests = build()
+                db.session.remove()
+                if not requests:
+                    continue
+                results, seconds = drive(port, method, requests, tokens,
+                                         args.concurrency)
+                routes.append(summarize(method, route, results, seconds,
+                                        args.concurrency))
+    finally:
+        process.terminate()
+        process.wait()
+        jwks_server.shutdown()
+
+    print(json.dumps({
+        'revision': git_revision(),
+        'server': args.server,
+        'workers': args.workers if args.server == 'gunicorn' else None,
+        'concurrency': args.concurrency,
+        'dataset': dataset,
+        'routes': routes
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Counts the SQL statements each endpoint issues per request.
+
+Seeds a small dataset, then drives every route in app.py through the flask
+test client with token verification stubbed out, so only database round
+trips are measured. Run it against a scratch database, the tables are
+truncated:
+
+    DATABASE_URL=postgresql://localhost:5432/capstone_bench \\
+        python benchmarks/bench_query_counts.py
+
+Prints a json report with the status code and statement count of every
+request, which can be diffed between commits.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('AUTH0_DOMAIN', 'localhost')
+os.environ.setdefault('API_AUDIENCE', 'casting')
+
+from sqlalchemy import event  # noqa: E402
+
+import auth.auth  # noqa: E402
+from app import create_app  # noqa: E402
+from auth.token_cache import build_verified_token  # noqa: E402
+from model import db, Actors, Casts, Movies, Starring  # noqa: E402
+
+
+PERMISSIONS = [
+    'get:actors', 'get:movies', 'get:casts', 'get:stars',
+    'post:actors', 'post:movies', 'post:casts', 'post:stars',
+    'patch:actors', 'patch:movies', 'patch:casts', 'patch:stars',
+    'delete:actors', 'delete:movies', 'delete:casts', 'delete:stars'
+]
+
+
+def seed(app):
+    with app.app_context():
+        db.session.execute(
+            'TRUNCATE starring, casts, actors, movies RESTART IDENTITY')
+        movies = [Movies(title='Movie {}'.format(i), description='Seeded',
+                         release_date='2020/1/4') for i in range(1, 5)]
+        actors = [Actors(name='Actor {}'.format(i), age=30, gender='female',
+                         nationality='Nigeria') for i in range(1, 11)]
+        db.session.add_all(movies + actors)
+        db.session.flush()
+        casts = [Casts(movie_id=movie.id) for movie in movies[:2]]
+        db.session.add_all(casts)
+        db.session.flush()
+        db.session.add_all([Starring(cast_id=cast.id, actor_id=actor.id)
+                            for cast in casts for actor in actors])
+        db.session.commit()
+
+
+def requests():
+    actor = {'name': 'Bench', 'age': 30, 'gender': 'male',
+             'nationality': 'Nigeria'}
+    movie = {'title': 'Bench', 'description': 'Bench',
+             'release_date': '2020/1/4'}
+    return [
+        ('GET', '/actors', None),
+        ('GET', '/actors/1', None),
+        ('GET', '/actors/nationality/Nigeria', None),
+        ('GET', '/actors/1/movies', None),
+        ('GET', '/movies', None),
+        ('GET', '/movies/1', None),
+        ('GET', '/movies/1/cast', None),
+        ('GET', '/casts', None),
+        ('GET', '/casts/1', None),
+        ('GET', '/stars', None),
+        ('GET', '/stars/1', None),
+        ('POST', '/movies', movie),
+        ('POST', '/casts', {'movie_id': 3}),
+        ('POST', '/casts', {'movie_id': 3}),
+        ('POST', '/actors', actor),
+        ('POST', '/stars', {'cast_id': 1, 'actor_id': 11}),
+        ('POST', '/stars', {'cast_id': 1, 'actor_id': 11}),
+        ('POST', '/stars', {'cast_id': 1, 'actor_id': 1000}),
+        ('POST', '/movies/bulk', [movie] * 10),
+        ('POST', '/actors/bulk', [actor] * 10),
+        ('POST', '/casts/bulk', [{'movie_id': 4}, {'movie_id': 3}]),
+        ('POST', '/stars/bulk', [{'cast_id': 2, 'actor_id': actor_id}
+                                 for actor_id in range(1, 13)]),
+        ('PATCH', '/actors/1', actor),
+        ('PATCH', '/movies/1', movie),
+        ('PATCH', '/casts/3', {'movie_id': 4}),
+        ('PATCH', '/stars/1', {'cast_id': 2, 'actor_id': 11}),
+        ('DELETE', '/stars/2', None),
+        ('DELETE', '/casts/2', None),
+        ('DELETE', '/actors/1', None),
+        ('DELETE', '/movies/1', None),
+    ]
+
+
+def main():
+    verified = build_verified_token({'permissions': PERMISSIONS})
+    auth.auth.verify_token = lambda token: verified
+
+    app = create_app()
+    seed(app)
+    with app.app_context():
+        engine = db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer benchmark'}
+    report = []
+    for method, path, body in requests():
+        del statements[:]
+        response = client.open(path, method=method, json=body,
+                               headers=headers)
+        report.append({
+            'method': method,
+            'path': path,
+            'status': response.status_code,
+            'queries': len(statements)
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Compares the per-row CPU time and memory of loading and serializing list
+endpoint rows as ORM instances (`db.session.query(Model)` + `format()`) and
+as column-projected rows (`column_query(Model)` + `format_row()`).
+
+Seeds the tables with --seed, which truncates them, so run it against a
+scratch database:
+
+    DATABASE_URL=postgresql://localhost:5432/capstone_bench \\
+        python benchmarks/bench_read_path.py --seed --rows 10000
+
+Prints a json report with, for every model, the time per row and the peak
+memory allocated while loading and serializing --rows rows.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+from flask import Flask
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from model import (db, setup_db, column_query, Actors, Casts,  # noqa: E402
+                   Movies, Starring)
+
+
+MODELS = [Actors, Movies, Casts, Starring]
+
+
+def seed(rows):
+    db.session.execute(text(
+        "TRUNCATE starring, casts, actors, movies RESTART IDENTITY"))
+    db.session.execute(text(
+        "INSERT INTO actors (name, age, gender, nationality) "
+        "SELECT 'Actor ' || i, 20 + i % 60, "
+        "CASE WHEN i % 2 = 0 THEN 'male' ELSE 'female' END, "
+        "'Nationality ' || i % 50 FROM generate_series(1, :rows) AS i"),
+        {'rows': rows})
+    db.session.execute(text(
+        "INSERT INTO movies (title, description, release_date) "
+        "SELECT 'Movie ' || i, 'Description ' || i, "
+        "DATE '2000-01-01' + i % 7000 FROM generate_series(1, :rows) AS i"),
+        {'rows': rows})
+    db.session.execute(text(
+        "INSERT INTO casts (movie_id) SELECT id FROM movies"))
+    db.session.execute(text(
+        "INSERT INTO starring (cast_id, actor_id) "
+        "SELECT i, 1 + (i * 7919) % :rows "
+        "FROM generate_series(1, :rows) AS i"), {'rows': rows})
+    db.session.commit()
+
+
+def orm_read(model, rows):
+    result = [record.format() for record in db.session.query(model).order_by(
+        model.id).limit(rows).all()]
+    db.session.remove()
+    return result
+
+
+def projected_read(model, rows):
+    result = [model.format_row(row) for row in column_query(model).order_by(
+        model.id).limit(rows).all()]
+    db.session.remove()
+    return result
+
+
+def measure(read, model, rows, repeat):
+    seconds = min(timeit.repeat(lambda: read(model, rows), number=1,
+                                repeat=repeat))
+    tracemalloc.start()
+    read(model, rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'us_per_row': round(seconds / rows * 1e6, 2),
+        'peak_bytes_per_row': peak // rows
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', action='store_true',
+                        help='truncate the tables and load --rows rows each')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    setup_db(app, os.environ['DATABASE_URL'])
+    report = []
+    with app.app_context():
+        if args.seed:
+            seed(args.rows)
+        for model in MODELS:
+            assert orm_read(model, args.rows) == projected_read(model,
+                                                                args.rows)
+            report.append({
+                'model': model.__name__,
+                'orm': measure(orm_read, model, args.rows, args.repeat),
+                'projected': measure(projected_read, model, args.rows,
+                                     args.repeat)
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
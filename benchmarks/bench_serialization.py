@@ -0,0 +1,96 @@
+"""
+Times the serialization of movie records, comparing Movies.format with the
+strftime based date formatting it replaced.
+
+Only transient Movies instances are built, no database is needed:
+
+    python benchmarks/bench_serialization.py --rows 10000
+
+Prints a json report with the time per record of each variant, after
+checking that both produce the same output.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from model import Movies, format_date  # noqa: E402
+
+
+def strftime_date_format(movie):
+    date = movie.release_date
+    _format = str(date.strftime("%a"))
+    _format += ' ' + str(date.strftime("%b"))
+    _format += ' ' + str(date.strftime("%d"))
+    _format += ' ' + str(date.strftime("%Y"))
+    return _format
+
+
+def strftime_format(movie):
+    return {
+        'id': movie.id,
+        'title': movie.title,
+        'release_date': strftime_date_format(movie),
+        'description': movie.description
+    }
+
+
+def make_movies(rows, distinct_dates):
+    start = date(2000, 1, 1)
+    dates = [start + timedelta(days=day)
+             for day in random.sample(range(20000), distinct_dates)]
+    movies = []
+    for i in range(rows):
+        movie = Movies(title='Movie {}'.format(i), description='Description',
+                       release_date=dates[i % distinct_dates])
+        movie.id = i + 1
+        movies.append(movie)
+    return movies
+
+
+def per_row_ns(function, movies, repeat):
+    seconds = min(timeit.repeat(lambda: [function(movie) for movie in movies],
+                                number=1, repeat=repeat))
+    return round(seconds / len(movies) * 1e9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--distinct-dates', type=int, default=2000,
+                        help='number of distinct release dates')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    movies = make_movies(args.rows, min(args.distinct_dates, args.rows))
+    for movie in movies:
+        assert movie.format() == strftime_format(movie), movie
+    # the date cache is warm in the steady state of a running server
+    [movie.get_date_format() for movie in movies]
+
+    report = {
+        'rows': args.rows,
+        'distinct_dates': min(args.distinct_dates, args.rows),
+        'date_ns_per_row': {
+            'strftime': per_row_ns(strftime_date_format, movies, args.repeat),
+            'format_date': per_row_ns(Movies.get_date_format, movies,
+                                      args.repeat)
+        },
+        'format_ns_per_row': {
+            'strftime': per_row_ns(strftime_format, movies, args.repeat),
+            'format': per_row_ns(Movies.format, movies, args.repeat)
+        },
+        'format_date_cache': format_date.cache_info()._asdict()
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
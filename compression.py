@@ -0,0 +1,104 @@
+"""
+Compression of the json responses, negotiated through Accept-Encoding.
+Brotli is preferred when the brotli package is installed, gzip otherwise.
+
+Responses under COMPRESS_MIN_SIZE bytes are sent as is. Streamed responses
+are compressed chunk by chunk, each chunk is flushed so the client keeps
+receiving data as it is produced.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson'
+}
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def compress_stream(chunks, encoding, level):
+    """
+    Compresses an iterable of chunks incrementally, flushing after every
+    chunk
+
+    :param chunks: response body chunks
+    :type chunks: iterable
+    :param encoding: br or gzip
+    :type encoding: str
+    :param level: brotli quality or gzip level
+    :type level: int
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        process, flush = compressor.process, compressor.flush
+        finish = compressor.finish
+    else:
+        # wbits 31 writes the gzip container
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+        finish = compressor.flush
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            yield process(chunk) + flush()
+    yield finish()
+
+
+def init_compression(app):
+    """
+    Compresses the responses of app from its COMPRESS_MIN_SIZE,
+    COMPRESS_LEVEL and COMPRESS_BROTLI_QUALITY config values
+
+    :param app: flask app
+    :type app: Flask
+    """
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    levels = {
+        'br': app.config.get('COMPRESS_BROTLI_QUALITY', 4),
+        'gzip': app.config.get('COMPRESS_LEVEL', 6)
+    }
+
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES or
+                response.direct_passthrough or
+                'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding,
+                                                levels[encoding])
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config.get('COMPRESS_MIN_SIZE', 1024):
+                return response
+            response.set_data(compress(data, encoding, levels[encoding]))
+        response.headers['Content-Encoding'] = encoding
+        # the compressed body is a different byte sequence, but it is the
+        # same representation, as a weak etag says
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,149 @@
+"""
+Per-request instrumentation: the time spent authenticating, querying the
+database and serializing, and the number of queries. The figures are sent
+in a Server-Timing header, unless SERVER_TIMING is off, and passed to the
+observers registered with add_timing_observer once the response is ready.
+"""
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+SERVER_TIMING_PHASES = ('auth', 'jwks', 'jwt', 'db', 'serialize')
+
+
+class RequestTiming:
+    """
+    Timing of one request. Phases are in seconds, `view` is the time spent
+    in the view function, `serialize` the part of it outside the database.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.query_count = 0
+        self.duration = None
+        self.endpoint = None
+        self.method = None
+        self.status = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def finish(self, response):
+        self.duration = time.perf_counter() - self.started
+        self.endpoint = request.endpoint
+        self.method = request.method
+        self.status = response.status_code
+        if 'view' in self.phases:
+            self.phases['serialize'] = max(
+                self.phases['view'] - self.phases.get('db', 0.0), 0.0)
+
+    def server_timing(self):
+        """
+        Formats the timing as a Server-Timing header value, in milliseconds
+        """
+        metrics = []
+        for phase in SERVER_TIMING_PHASES:
+            if phase in self.phases:
+                metric = '{};dur={:.2f}'.format(phase,
+                                                self.phases[phase] * 1000)
+                if phase == 'db':
+                    metric += ';desc="{} queries"'.format(self.query_count)
+                metrics.append(metric)
+        metrics.append('total;dur={:.2f}'.format(self.duration * 1000))
+        return ', '.join(metrics)
+
+
+def current_timing():
+    if has_request_context():
+        return g.get('timing')
+    return None
+
+
+@contextmanager
+def timed(phase):
+    """
+    Adds the time spent in the block to phase of the current request, does
+    nothing outside of an instrumented request
+    """
+    timing = current_timing()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    if current_timing() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_query(conn, cursor, statement, parameters, context, executemany):
+    record_query(conn)
+
+
+@event.listens_for(Engine, 'handle_error')
+def failed_query(context):
+    if context.connection is not None:
+        record_query(context.connection)
+
+
+def record_query(conn):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    timing = current_timing()
+    if timing is not None:
+        timing.add('db', seconds)
+        timing.query_count += 1
+
+
+def add_timing_observer(app, observer):
+    """
+    Calls observer with the RequestTiming of every request of app
+
+    :param app: flask app
+    :type app: Flask
+    :param observer: called with the timing once the response is ready
+    :type observer: callable
+    """
+    app.extensions['timing_observers'].append(observer)
+
+
+def init_instrumentation(app):
+    """
+    Instruments the requests of app. Register it before the other
+    after_request hooks, flask runs them in reverse order and the total
+    should include them.
+
+    :param app: flask app
+    :type app: Flask
+    """
+    app.extensions['timing_observers'] = []
+
+    @app.before_request
+    def start_timing():
+        g.timing = RequestTiming()
+
+    @app.after_request
+    def report_timing(response):
+        timing = g.get('timing')
+        if timing is None:
+            return response
+        timing.finish(response)
+        if app.config.get('SERVER_TIMING', True):
+            response.headers['Server-Timing'] = timing.server_timing()
+        for observer in app.extensions['timing_observers']:
+            observer(timing)
+        return response
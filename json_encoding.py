@@ -0,0 +1,102 @@
+"""
+JSON encoding of the responses. Uses orjson when it is installed and the
+standard library json module otherwise, selected by the JSON_BACKEND config
+value: auto (default), orjson or stdlib.
+
+Both backends produce the same compact, utf-8 encoded output and write
+dates in ISO 8601 form.
+"""
+import json
+from datetime import date
+
+from flask import current_app
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(value).__name__))
+
+
+def stdlib_dumps(obj, sort_keys=False):
+    return json.dumps(obj, default=default, sort_keys=sort_keys,
+                      ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def orjson_dumps(obj, sort_keys=False):
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+
+BACKENDS = {
+    'stdlib': stdlib_dumps,
+    'orjson': orjson_dumps
+}
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """
+    Encoder of jsonify, writes dates like the fast path does instead of as
+    HTTP dates
+    """
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+
+def init_json(app):
+    """
+    Selects the JSON backend of app from its JSON_BACKEND config value
+
+    :param app: flask app
+    :type app: Flask
+    """
+    backend = app.config.get('JSON_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'stdlib' if orjson is None else 'orjson'
+    if backend not in BACKENDS:
+        raise ValueError("Invalid value '{}' for JSON_BACKEND, acceptable "
+                         "values are auto/{}".format(backend,
+                                                     '/'.join(BACKENDS)))
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_BACKEND is orjson but orjson is not "
+                           "installed")
+    app.extensions['json_dumps'] = BACKENDS[backend]
+    app.json_encoder = JSONEncoder
+
+
+def encoder():
+    """
+    Returns the dumps function of the current app, which encodes an object
+    to json bytes honoring JSON_SORT_KEYS
+
+    :rtype: callable
+    """
+    dumps = current_app.extensions['json_dumps']
+    if current_app.config['JSON_SORT_KEYS']:
+        return lambda obj: dumps(obj, sort_keys=True)
+    return dumps
+
+
+def json_response(payload, status=200):
+    """
+    Encodes payload with the app's JSON backend, a faster jsonify
+
+    :param payload: json serializable object
+    :type payload: dict
+    :param status: http status code
+    :type status: int
+    :rtype: Response
+    """
+    return current_app.response_class(
+        encoder()(payload) + b'\n', status=status,
+        mimetype=current_app.config['JSONIFY_MIMETYPE'])
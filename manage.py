@@ -2,7 +2,7 @@
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
-from app import app
+from app import APP as app
 from model import db
 
 migrate = Migrate(app, db)
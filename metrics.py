@@ -0,0 +1,317 @@
+"""
+Prometheus metrics: requests, latency and database queries per route, and
+the hits and misses of the JWKS, token and response caches, served in the
+text exposition format.
+
+Every worker process adds its samples to its own memory-mapped file in
+METRICS_DIR and the /metrics route sums the files of all the workers, so
+whichever worker answers the scrape reports for the whole gunicorn pool.
+The files of workers that exited are kept, so the counters never go
+backwards; empty the directory before starting the server. Without
+METRICS_DIR the samples are kept in memory and only cover the process
+answering the scrape.
+"""
+import glob
+import mmap
+import os
+import struct
+import threading
+
+from instrumentation import add_timing_observer
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, float('inf'))
+
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests handled, by endpoint, method and status.'),
+    'http_request_duration_seconds': (
+        'histogram', 'Time to build the response, by endpoint and method.'),
+    'db_queries_total': (
+        'counter', 'Database queries run by requests, by endpoint.'),
+    'db_query_duration_seconds_total': (
+        'counter', 'Time requests spent in the database, by endpoint.'),
+    'cache_hits_total': (
+        'counter', 'Lookups answered from the cache, by cache.'),
+    'cache_misses_total': (
+        'counter', 'Lookups the cache could not answer, by cache.')
+}
+
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+# file layout: the number of bytes used, then one entry per sample, the
+# length of its key, the key padded so the value is 8 bytes aligned, and
+# the value
+HEADER = struct.Struct('<I4x')
+LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+
+def entry_size(key_length):
+    return (LENGTH.size + key_length + 7) // 8 * 8 + VALUE.size
+
+
+def read_entries(data, used):
+    """
+    Yields the (key, value, value offset) entries of a metrics file
+    """
+    offset = HEADER.size
+    while offset < used:
+        length = LENGTH.unpack_from(data, offset)[0]
+        key = bytes(data[offset + LENGTH.size:
+                         offset + LENGTH.size + length]).decode('utf-8')
+        value_offset = offset + entry_size(length) - VALUE.size
+        yield key, VALUE.unpack_from(data, value_offset)[0], value_offset
+        offset += entry_size(length)
+
+
+def read_file(path):
+    with open(path, 'rb') as metrics_file:
+        data = metrics_file.read()
+    if len(data) < HEADER.size:
+        return
+    for key, value, _ in read_entries(data, HEADER.unpack_from(data)[0]):
+        yield key, value
+
+
+class MmapValues:
+    """
+    Sample values of one process in a memory-mapped file. Only the owning
+    process writes to it, the others read it.
+
+    :param path: file path, an existing file is reopened
+    :type path: str
+    :param initial_size: initial size of a new file in bytes
+    :type initial_size: int
+    """
+
+    def __init__(self, path, initial_size=1 << 16):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < HEADER.size:
+            self._file.truncate(initial_size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = HEADER.unpack_from(self._map)[0] or HEADER.size
+        self._offsets = {key: offset for key, _, offset
+                         in read_entries(self._map, self._used)}
+
+    def inc(self, key, amount):
+        offset = self._offsets.get(key)
+        if offset is None:
+            offset = self._add(key)
+        value = VALUE.unpack_from(self._map, offset)[0]
+        VALUE.pack_into(self._map, offset, value + amount)
+
+    def items(self):
+        return [(key, VALUE.unpack_from(self._map, offset)[0])
+                for key, offset in self._offsets.items()]
+
+    def _add(self, key):
+        encoded = key.encode('utf-8')
+        size = entry_size(len(encoded))
+        if self._used + size > len(self._map):
+            new_size = max(len(self._map) * 2, self._used + size)
+            self._map.close()
+            self._file.truncate(new_size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        LENGTH.pack_into(self._map, self._used, len(encoded))
+        start = self._used + LENGTH.size
+        self._map[start:start + len(encoded)] = encoded
+        offset = self._used + size - VALUE.size
+        VALUE.pack_into(self._map, offset, 0.0)
+        # readers only look up to the used size, bump it last
+        self._used += size
+        HEADER.pack_into(self._map, 0, self._used)
+        self._offsets[key] = offset
+        return offset
+
+
+class LocalValues:
+    """
+    Sample values of one process, in memory
+    """
+
+    def __init__(self):
+        self._values = {}
+
+    def inc(self, key, amount):
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self):
+        return list(self._values.items())
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def sample_key(name, labels):
+    """
+    Formats a sample name and its labels as in the exposition format
+
+    :param name: sample name
+    :type name: str
+    :param labels: (label, value) pairs
+    :type labels: tuple
+    """
+    if not labels:
+        return name
+    return '{}{{{}}}'.format(name, ','.join(
+        '{}="{}"'.format(label, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for label, value in labels))
+
+
+def family(key):
+    name = key.split('{', 1)[0]
+    for suffix in HISTOGRAM_SUFFIXES:
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+class Metrics:
+    """
+    Metrics of the current process, written to a file per process in
+    directory when there is one
+
+    :param directory: directory shared by the worker processes
+    :type directory: str
+    :param caches: objects counting their hits and misses, by cache name
+    :type caches: dict
+    """
+
+    def __init__(self, directory=None, caches=None):
+        self.directory = directory
+        self.caches = caches or {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._values = None
+        self._seen = {}
+
+    def _store(self):
+        # opened on first use, after gunicorn forked the worker
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._seen = {}
+            if self.directory:
+                self._values = MmapValues(os.path.join(
+                    self.directory, 'metrics_{}.db'.format(pid)))
+            else:
+                self._values = LocalValues()
+        return self._values
+
+    def inc(self, name, labels=(), amount=1.0):
+        key = sample_key(name, labels)
+        with self._lock:
+            self._store().inc(key, amount)
+
+    def observe(self, name, labels, value):
+        """
+        Adds value to the histogram name
+        """
+        with self._lock:
+            store = self._store()
+            # every bucket is written, so they are stored in order
+            for bucket in LATENCY_BUCKETS:
+                store.inc(sample_key(name + '_bucket', labels + (
+                    ('le', format_value(bucket)),)),
+                    1.0 if value <= bucket else 0.0)
+            store.inc(sample_key(name + '_sum', labels), value)
+            store.inc(sample_key(name + '_count', labels), 1.0)
+
+    def sync(self, name, labels, total):
+        """
+        Brings a counter kept by another object of this process up to its
+        current total, a total lower than the last one is taken as a reset
+        """
+        key = sample_key(name, labels)
+        with self._lock:
+            store = self._store()
+            seen = self._seen.get(key, 0)
+            # a total below the last one seen was reset, e.g. by clear(),
+            # everything counted since then is new
+            delta = total - seen if total >= seen else total
+            if delta > 0:
+                store.inc(key, delta)
+            self._seen[key] = total
+
+    def sync_caches(self):
+        for name, cache in self.caches.items():
+            if cache is not None:
+                self.sync('cache_hits_total', (('cache', name),), cache.hits)
+                self.sync('cache_misses_total', (('cache', name),),
+                          cache.misses)
+
+    def collect(self):
+        """
+        Returns the value of every sample, summed over the processes
+        """
+        with self._lock:
+            items = self._store().items()
+        if not self.directory:
+            return dict(items)
+        totals = {}
+        paths = sorted(glob.glob(os.path.join(self.directory,
+                                              'metrics_*.db')))
+        for path in paths:
+            for key, value in read_file(path):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        """
+        Formats the samples in the Prometheus text exposition format
+        """
+        self.sync_caches()
+        families = {}
+        for key, value in self.collect().items():
+            families.setdefault(family(key), []).append((key, value))
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            if name not in families:
+                continue
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.extend('{} {}'.format(key, format_value(value))
+                         for key, value in families[name])
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app, caches):
+    """
+    Records the requests of app from its METRICS_DIR config value
+
+    :param app: flask app, instrumented
+    :type app: Flask
+    :param caches: objects with hits and misses counters, by cache name
+    :type caches: dict
+    """
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    metrics = Metrics(directory, caches)
+    app.extensions['metrics'] = metrics
+
+    def record_request(timing):
+        endpoint = timing.endpoint or 'none'
+        metrics.inc('http_requests_total', (
+            ('endpoint', endpoint), ('method', timing.method),
+            ('status', timing.status)))
+        metrics.observe('http_request_duration_seconds', (
+            ('endpoint', endpoint), ('method', timing.method)),
+            timing.duration)
+        if timing.query_count:
+            metrics.inc('db_queries_total', (('endpoint', endpoint),),
+                        timing.query_count)
+            metrics.inc('db_query_duration_seconds_total',
+                        (('endpoint', endpoint),), timing.phases['db'])
+        metrics.sync_caches()
+
+    add_timing_observer(app, record_request)
@@ -0,0 +1,57 @@
+"""unique (cast_id, actor_id) on starring
+
+Revision ID: 2b060cae04f8
+Revises: efd0b1795dac
+Create Date: 2026-10-18 18:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b060cae04f8'
+down_revision = 'efd0b1795dac'
+branch_labels = None
+depends_on = None
+
+
+CONSTRAINT = 'uq_starring_cast_id_actor_id'
+
+
+def upgrade():
+    # assignments made before the constraint may be duplicated, keep the
+    # oldest row of each pair
+    op.execute('DELETE FROM starring WHERE id NOT IN ('
+               'SELECT MIN(id) FROM starring GROUP BY cast_id, actor_id)')
+
+    if op.get_context().dialect.name == 'postgresql':
+        # build the unique index without blocking writes, then attach it as
+        # the constraint unless db.create_all() already created it. The
+        # constraint's index leads with cast_id, which makes
+        # ix_starring_cast_id redundant.
+        with op.get_context().autocommit_block():
+            op.execute('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {} '
+                       'ON starring (cast_id, actor_id)'.format(CONSTRAINT))
+            op.execute("DO $$ BEGIN IF NOT EXISTS ("
+                       "SELECT 1 FROM pg_constraint WHERE conname = '{0}') "
+                       "THEN ALTER TABLE starring ADD CONSTRAINT {0} "
+                       "UNIQUE USING INDEX {0}; END IF; END $$".format(
+                           CONSTRAINT))
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_starring_cast_id')
+    else:
+        op.create_unique_constraint(CONSTRAINT, 'starring',
+                                    ['cast_id', 'actor_id'])
+        op.drop_index('ix_starring_cast_id', table_name='starring')
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                       'ix_starring_cast_id ON starring (cast_id)')
+            op.execute('ALTER TABLE starring DROP CONSTRAINT IF EXISTS '
+                       '{}'.format(CONSTRAINT))
+    else:
+        op.create_index('ix_starring_cast_id', 'starring', ['cast_id'])
+        op.drop_constraint(CONSTRAINT, 'starring', type_='unique')
@@ -0,0 +1,55 @@
+"""ON DELETE CASCADE on the casts and starring foreign keys
+
+Revision ID: 5b8ebd6ab5a5
+Revises: 2b060cae04f8
+Create Date: 2026-10-18 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8ebd6ab5a5'
+down_revision = '2b060cae04f8'
+branch_labels = None
+depends_on = None
+
+
+FOREIGN_KEYS = [
+    ('casts_movie_id_fkey', 'casts', 'movie_id', 'movies'),
+    ('starring_cast_id_fkey', 'starring', 'cast_id', 'casts'),
+    ('starring_actor_id_fkey', 'starring', 'actor_id', 'actors'),
+]
+
+
+def replace_foreign_keys(ondelete):
+    if op.get_context().dialect.name == 'postgresql':
+        # swap each constraint under its existing name as NOT VALID, which
+        # only holds the table lock for the catalog change, then commit and
+        # validate the existing rows without blocking writes
+        for name, table, column, referred in FOREIGN_KEYS:
+            op.execute('ALTER TABLE {0} DROP CONSTRAINT {1}, '
+                       'ADD CONSTRAINT {1} FOREIGN KEY ({2}) '
+                       'REFERENCES {3} (id) {4} NOT VALID'.format(
+                           table, name, column, referred,
+                           'ON DELETE {}'.format(ondelete)
+                           if ondelete else ''))
+        with op.get_context().autocommit_block():
+            for name, table, column, referred in FOREIGN_KEYS:
+                op.execute('ALTER TABLE {} VALIDATE CONSTRAINT {}'.format(
+                    table, name))
+    else:
+        for name, table, column, referred in FOREIGN_KEYS:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'],
+                                            ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
@@ -0,0 +1,49 @@
+"""add indexes for the nationality and starring lookups
+
+Revision ID: efd0b1795dac
+Revises:
+Create Date: 2026-10-18 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'efd0b1795dac'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_actors_nationality_id', 'actors', ['nationality', 'id']),
+    ('ix_starring_actor_id', 'starring', ['actor_id']),
+    ('ix_starring_cast_id', 'starring', ['cast_id']),
+]
+
+
+def upgrade():
+    # The tables are created by db.create_all(), which already builds these
+    # indexes on a fresh database, hence IF NOT EXISTS. On postgres they are
+    # built CONCURRENTLY, outside the migration transaction, so reads and
+    # writes to the tables are not blocked while the index builds.
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS {} '
+                           'ON {} ({})'.format(name, table,
+                                               ', '.join(columns)))
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+    else:
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table)
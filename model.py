@@ -1,10 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
+from functools import lru_cache
 import os
 
+from slow_queries import init_slow_query_log
+
 database_path = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
 
+# postgres rejects ids outside the integer column range before constraints
+# are checked, such ids can never reference a row
+MAX_ID = 2147483647
+
 
 def setup_db(app, database_path=database_path):
     app.config['SQLALCHEMY_DATABASE_URI'] = database_path
@@ -12,6 +19,54 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    init_slow_query_log(app, db.get_engine(app))
+
+
+# release dates are serialized as "Sat Jan 04 2020", the names are spelled
+# out rather than taken from the locale dependent strftime
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+          'Oct', 'Nov', 'Dec')
+
+
+@lru_cache(maxsize=4096)
+def format_date(date):
+    """
+    Formats a date as "Sat Jan 04 2020". Lists share few distinct release
+    dates, so the formatted strings are cached.
+
+    :param date: date to format
+    :type date: date
+    :rtype: str
+    """
+    return '%s %s %02d %d' % (WEEKDAYS[date.weekday()], MONTHS[date.month - 1],
+                              date.day, date.year)
+
+
+def column_query(model):
+    """
+    Query selecting the columns of model as lightweight named tuples rather
+    than ORM instances, skipping the identity map, attribute instrumentation
+    and relationships. Serialize the rows with the model's format_row.
+
+    :param model: model to select
+    :type model: db.Model
+    :rtype: Query
+    """
+    return db.session.query(*model.__table__.columns)
+
+
+def violated_constraint(error):
+    """
+    Returns the name of the constraint behind an IntegrityError, None when
+    the driver does not report it
+
+    :param error: error raised on flush or commit
+    :type error: IntegrityError
+    :rtype: str
+    """
+    diag = getattr(error.orig, 'diag', None)
+    return getattr(diag, 'constraint_name', None)
 
 
 class Movies(db.Model):
@@ -21,7 +76,7 @@ class Movies(db.Model):
     release_date = db.Column(db.Date, nullable=True)
     description = db.Column(db.String(500), nullable=False)
     cast = db.relationship('Casts', backref='movies_ref',
-                           cascade="all, delete-orphan")
+                           cascade="all, delete-orphan", passive_deletes=True)
 
     def __init__(self, title, release_date, description):
         self.title = title
@@ -33,20 +88,23 @@ class Movies(db.Model):
                f'{self.description}>'
 
     def format(self):
+        return self.format_row(self)
+
+    @staticmethod
+    def format_row(row):
+        release_date = row.release_date
         return {
-            'id': self.id,
-            'title': self.title,
-            'release_date': self.get_date_format(),
-            'description': self.description
+            'id': row.id,
+            'title': row.title,
+            'release_date': format_date(release_date)
+            if release_date is not None else None,
+            'description': row.description
         }
 
     def get_date_format(self):
-        date = self.release_date
-        _format = str(date.strftime("%a"))
-        _format += ' ' + str(date.strftime("%b"))
-        _format += ' ' + str(date.strftime("%d"))
-        _format += ' ' + str(date.strftime("%Y"))
-        return _format
+        if self.release_date is None:
+            return None
+        return format_date(self.release_date)
 
 
 class Actors(db.Model):
@@ -57,7 +115,13 @@ class Actors(db.Model):
     gender = db.Column(db.String, nullable=False)
     nationality = db.Column(db.String(150), nullable=False)
     starring = db.relationship('Starring', backref='actors_ref',
-                               cascade="all, delete-orphan")
+                               cascade="all, delete-orphan",
+                               passive_deletes=True)
+
+    # serves the nationality filter and its keyset pagination on id
+    __table_args__ = (
+        db.Index('ix_actors_nationality_id', 'nationality', 'id'),
+    )
 
     def __init__(self, name, age, gender, nationality):
         self.name = name
@@ -70,22 +134,28 @@ class Actors(db.Model):
                f' {self.nationality}>'
 
     def format(self):
+        return self.format_row(self)
+
+    @staticmethod
+    def format_row(row):
         return {
-            'id': self.id,
-            'name': self.name,
-            'age': self.age,
-            'gender': self.gender,
-            'nationality': self.nationality
+            'id': row.id,
+            'name': row.name,
+            'age': row.age,
+            'gender': row.gender,
+            'nationality': row.nationality
         }
 
 
 class Casts(db.Model):
     __tablename__ = 'casts'
     id = db.Column(db.Integer, primary_key=True)
-    movie_id = db.Column(db.Integer, db.ForeignKey('movies.id'),
+    movie_id = db.Column(db.Integer, db.ForeignKey('movies.id',
+                                                   ondelete='CASCADE'),
                          nullable=False, unique=True)
     starring = db.relationship('Starring', backref='casts_ref',
-                               cascade="all, delete-orphan")
+                               cascade="all, delete-orphan",
+                               passive_deletes=True)
 
     def __init__(self, movie_id):
         self.movie_id = movie_id
@@ -94,19 +164,32 @@ class Casts(db.Model):
         return f'<Casts {self.id}, {self.movie_id}>'
 
     def format(self):
+        return self.format_row(self)
+
+    @staticmethod
+    def format_row(row):
         return {
-            'id': self.id,
-            'movie_id': self.movie_id
+            'id': row.id,
+            'movie_id': row.movie_id
         }
 
 
 class Starring(db.Model):
     __tablename__ = 'starring'
     id = db.Column(db.Integer, primary_key=True)
-    cast_id = db.Column(db.Integer, db.ForeignKey('casts.id'), nullable=False,
-                        unique=False)
-    actor_id = db.Column(db.Integer, db.ForeignKey('actors.id'),
-                         nullable=False, unique=False)
+    cast_id = db.Column(db.Integer, db.ForeignKey('casts.id',
+                                                  ondelete='CASCADE'),
+                        nullable=False, unique=False)
+    actor_id = db.Column(db.Integer, db.ForeignKey('actors.id',
+                                                   ondelete='CASCADE'),
+                         nullable=False, unique=False, index=True)
+
+    # an actor is assigned to a cast once, the constraint's index also
+    # serves the cast_id lookups
+    __table_args__ = (
+        db.UniqueConstraint('cast_id', 'actor_id',
+                            name='uq_starring_cast_id_actor_id'),
+    )
 
     def __init__(self, cast_id, actor_id):
         self.cast_id = cast_id
@@ -116,8 +199,12 @@ class Starring(db.Model):
         return f'<Starring {self.id}, {self.cast_id}, {self.actor_id}>'
 
     def format(self):
+        return self.format_row(self)
+
+    @staticmethod
+    def format_row(row):
         return {
-            'id': self.id,
-            'cast_id': self.cast_id,
-            'actor_id': self.actor_id
+            'id': row.id,
+            'cast_id': row.cast_id,
+            'actor_id': row.actor_id
         }
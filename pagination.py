@@ -0,0 +1,123 @@
+from flask import abort, current_app, request
+from sqlalchemy import Integer, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from validation import parse_id
+
+
+def page_args():
+    """
+    Reads the `limit` and `after` query string arguments, clamping limit to
+    the MAX_PAGE_SIZE config value
+
+    :return: page size and the id the page starts after
+    :rtype: tuple
+    """
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'])
+    after = request.args.get('after')
+    try:
+        limit = int(limit)
+        if after is not None:
+            after = int(after)
+    except ValueError:
+        abort(400, "Invalid value for limit or after, expected integers")
+    if limit <= 0:
+        abort(400, "Invalid value '{}' for limit, expected a positive "
+                   "integer".format(limit))
+    return min(limit, current_app.config['MAX_PAGE_SIZE']), after
+
+
+def paginate(query, column):
+    """
+    Applies keyset pagination on column to query. One extra row is fetched
+    to tell whether another page follows, so the last page never needs an
+    empty round trip.
+
+    :param query: query to paginate
+    :type query: Query
+    :param column: unique, indexed column to page on, usually the primary key
+    :type column: Column
+    :return: rows of the page and the cursor of the next page, None on the
+        last page
+    :rtype: tuple
+    """
+    limit, after = page_args()
+    if after is not None:
+        query = query.filter(column > after)
+    rows = query.order_by(column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], column.key)
+    return rows, next_cursor
+
+
+def ids_arg():
+    """
+    Reads the `ids` query string argument, a comma separated list of at
+    most MAX_PAGE_SIZE ids. Repeated ids are dropped.
+
+    :return: ids in request order, None when the argument is absent
+    :rtype: list
+    """
+    value = request.args.get('ids')
+    if value is None:
+        return None
+    max_ids = current_app.config['MAX_PAGE_SIZE']
+    ids, seen = [], set()
+    for part in value.split(','):
+        record_id = parse_id(part)
+        if record_id is None:
+            abort(400, "Invalid value '{}' in ids, expected positive "
+                       "integers".format(part))
+        if record_id not in seen:
+            seen.add(record_id)
+            ids.append(record_id)
+            if len(ids) > max_ids:
+                abort(400, "At most {} ids can be requested at "
+                           "once".format(max_ids))
+    return ids
+
+
+def find_by_ids(query, column, ids):
+    """
+    Loads the rows of query whose column is in ids with a single
+    `column = ANY(:ids)` query, the statement text does not depend on the
+    number of ids
+
+    :param query: query to filter
+    :type query: Query
+    :param column: unique column the ids refer to
+    :type column: Column
+    :param ids: ids to load
+    :type ids: list
+    :return: rows found, in the order of ids, and the ids without a row
+    :rtype: tuple
+    """
+    rows = query.filter(column == any_(bindparam(
+        'ids', ids, type_=ARRAY(Integer)))).all()
+    by_id = {getattr(row, column.key): row for row in rows}
+    return ([by_id[record_id] for record_id in ids if record_id in by_id],
+            [record_id for record_id in ids if record_id not in by_id])
+
+
+def select_rows(query, column):
+    """
+    Selects the rows of a list endpoint: the rows listed in the `ids`
+    argument when it is present, see `find_by_ids`, a page otherwise, see
+    `paginate`
+
+    :param query: query to select from
+    :type query: Query
+    :param column: unique, indexed column, usually the primary key
+    :type column: Column
+    :return: rows and the response fields describing the selection,
+        `next_cursor` and with `ids` the list of `missing` ids
+    :rtype: tuple
+    """
+    ids = ids_arg()
+    if ids is None:
+        rows, next_cursor = paginate(query, column)
+        return rows, {'next_cursor': next_cursor}
+    rows, missing = find_by_ids(query, column, ids)
+    return rows, {'next_cursor': None, 'missing': missing}
@@ -0,0 +1,180 @@
+"""
+On-demand profiling of live workers. POST /admin/profile arms the worker
+answering it to profile its next requests, each profile is written to
+PROFILE_DIR as a file named after the endpoint:
+- cprofile: a pstats dump, e.g. `python -m pstats get_movies-*.pstats`
+- sampler: stacks sampled every PROFILE_INTERVAL seconds from a separate
+  thread, written in the collapsed format read by flamegraph.pl and
+  speedscope, lighter than cProfile on deep call trees
+
+Profiling is off unless PROFILE_DIR is set, no hook is registered then.
+"""
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+
+
+PROFILERS = ('cprofile', 'sampler')
+
+
+def collapse(frame):
+    """
+    Formats the stack of frame as `file:function` entries separated by
+    semicolons, outermost first
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(os.path.basename(code.co_filename),
+                                    code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples the stack of a thread from a background thread
+
+    :param thread_id: identifier of the sampled thread
+    :type thread_id: int
+    :param interval: seconds between samples
+    :type interval: float
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as collapsed:
+            for stack, count in self.stacks.most_common():
+                collapsed.write('{} {}\n'.format(stack, count))
+
+
+class Profiler:
+    """
+    Profiles the next requests of this process once armed
+
+    :param directory: directory the profiles are written to
+    :type directory: str
+    :param mode: cprofile or sampler
+    :type mode: str
+    :param interval: seconds between the samples of the sampler
+    :type interval: float
+    """
+
+    def __init__(self, directory, mode='cprofile', interval=0.005):
+        if mode not in PROFILERS:
+            raise ValueError("Invalid value '{}' for PROFILER, acceptable "
+                             "values are {}".format(mode,
+                                                    '/'.join(PROFILERS)))
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self.remaining = 0
+        self.endpoint = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def arm(self, requests, endpoint=None):
+        """
+        Profiles the next requests requests, of endpoint when given
+        """
+        with self._lock:
+            self.remaining = requests
+            self.endpoint = endpoint
+
+    def start(self):
+        """
+        Starts profiling the current request if the profiler is armed for
+        it
+
+        :return: the running profiler and its sequence number, None if the
+            request is not profiled
+        """
+        if not self.remaining:
+            return None
+        with self._lock:
+            if not self.remaining or self.endpoint not in (None,
+                                                           request.endpoint):
+                return None
+            self.remaining -= 1
+            self._sequence += 1
+            sequence = self._sequence
+        if self.mode == 'sampler':
+            profile = StackSampler(threading.get_ident(), self.interval)
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+        return profile, sequence
+
+    def stop(self, profile, sequence, endpoint):
+        """
+        Stops profile and writes it to the directory, returns its path
+        """
+        if self.mode == 'sampler':
+            profile.stop()
+            extension = 'collapsed'
+        else:
+            profile.disable()
+            extension = 'pstats'
+        path = os.path.join(self.directory, '{}-{}-{}-{}.{}'.format(
+            endpoint or 'none', datetime.now().strftime('%Y%m%dT%H%M%S'),
+            os.getpid(), sequence, extension))
+        if self.mode == 'sampler':
+            profile.dump(path)
+        else:
+            profile.dump_stats(path)
+        return path
+
+
+def init_profiling(app):
+    """
+    Sets up the profiler of app from its PROFILE_DIR, PROFILER and
+    PROFILE_INTERVAL config values, does nothing without PROFILE_DIR
+
+    :param app: flask app
+    :type app: Flask
+    """
+    directory = app.config.get('PROFILE_DIR')
+    if not directory:
+        app.extensions['profiler'] = None
+        return
+    os.makedirs(directory, exist_ok=True)
+    profiler = Profiler(directory, app.config.get('PROFILER', 'cprofile'),
+                        app.config.get('PROFILE_INTERVAL', 0.005))
+    app.extensions['profiler'] = profiler
+
+    @app.before_request
+    def start_profile():
+        running = profiler.start()
+        if running is not None:
+            g.profile = running
+
+    @app.teardown_request
+    def stop_profile(exception=None):
+        running = g.pop('profile', None)
+        if running is not None:
+            profiler.stop(*running, request.endpoint)
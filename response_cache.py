@@ -0,0 +1,312 @@
+"""
+Read-through cache of GET responses.
+
+Cached responses are keyed on the endpoint, its arguments, the caller's
+permissions and the version of every table the endpoint reads. Writes to a
+table bump its version once their transaction commits, so the entries that
+read it are never served again and age out of the cache.
+
+The cache talks to its store through a subset of the redis client API
+(`get`, `set`, `mget`, `incr`), so a redis client can be plugged in to
+share entries and versions between workers. LocalClient is an in-process
+LRU store, consistent as long as a single worker process writes.
+
+Configured by the RESPONSE_CACHE config value: off (default), local, or a
+redis:// url, which requires the redis package.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Delete, UpdateBase
+
+
+class LocalClient:
+    """
+    In-process store implementing the redis commands used by ResponseCache.
+    Entries are evicted least recently used first, counters are kept apart
+    and never evicted.
+
+    :param max_entries: maximum number of entries
+    :type max_entries: int
+    :param clock: returns the current unix time
+    :type clock: callable
+    """
+
+    def __init__(self, max_entries=512, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[name]
+                return None
+            self._entries.move_to_end(name)
+            return value
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            if isinstance(value, int):
+                if nx and name in self._counters:
+                    return None
+                self._counters[name] = value
+                return True
+            if nx and name in self._entries:
+                return None
+            expires_at = self.clock() + ex if ex else None
+            self._entries[name] = (expires_at, value)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def mget(self, names):
+        with self._lock:
+            return [self._counters.get(name) for name in names]
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+
+class ResponseCache:
+    """
+    Response cache over a redis-like client
+
+    :param client: LocalClient or redis client
+    :param ttl: seconds an entry is kept, bounds the staleness of writes
+        made outside the application
+    :type ttl: int
+    """
+
+    def __init__(self, client, ttl=300):
+        self.client = client
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def versions(self, tables):
+        """
+        Returns the current version of every table. A version missing from
+        the store, never set or evicted, starts at the current time in
+        milliseconds so it cannot match a version of older entries.
+
+        :param tables: table names
+        :type tables: tuple
+        :rtype: list
+        """
+        names = ['version:' + table for table in tables]
+        versions = self.client.mget(names)
+        for index, version in enumerate(versions):
+            if version is None:
+                self.client.set(names[index], int(time.time() * 1000),
+                                nx=True)
+                versions[index] = self.client.mget([names[index]])[0]
+        return [int(version) for version in versions]
+
+    def invalidate(self, tables):
+        """
+        Bumps the version of tables, the entries that read them are no longer
+        served
+        """
+        for table in sorted(tables):
+            self.client.incr('version:' + table)
+
+    def get(self, key):
+        """
+        Returns the cached (mimetype, etag, body) of key, None on a miss
+        """
+        entry = self.client.get('response:' + key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        mimetype, etag, body = entry.split(b'\n', 2)
+        return mimetype.decode('utf-8'), etag.decode('utf-8'), body
+
+    def set(self, key, mimetype, etag, body):
+        self.client.set('response:' + key, b'\n'.join([
+            mimetype.encode('utf-8'), etag.encode('utf-8'), body]),
+            ex=self.ttl)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def request_key(versions):
+    """
+    Builds the cache key of the current request from its endpoint,
+    arguments, the caller's permissions and the versions of the tables
+    """
+    parts = [
+        request.endpoint,
+        repr(sorted(request.view_args.items())),
+        repr(sorted(request.args.items(multi=True))),
+        ','.join(sorted(g.get('permissions') or ())),
+        ','.join(str(version) for version in versions)
+    ]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def cached(*tables):
+    """
+    Caches the 200 responses of a GET view reading tables and makes them
+    conditional: they carry a strong ETag, the hash of the body, and
+    requests whose If-None-Match matches it are answered 304 Not Modified.
+    With the cache enabled the ETag is stored with the entry, so an
+    unchanged response is confirmed without running the view.
+
+    Apply it below requires_auth, so the permission check runs on every
+    request.
+
+    :param tables: names of the tables the view reads
+    :type tables: str
+    """
+    def cached_decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return func(*args, **kwargs)
+            cache = current_app.extensions.get('response_cache')
+            if cache is None:
+                response = current_app.make_response(func(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    response.add_etag()
+                return response.make_conditional(request)
+
+            key = request_key(cache.versions(tables))
+            entry = cache.get(key)
+            if entry is not None:
+                mimetype, etag, body = entry
+                response = current_app.response_class(body,
+                                                      mimetype=mimetype)
+                response.set_etag(etag)
+                response.headers['X-Cache'] = 'HIT'
+                return response.make_conditional(request)
+            response = current_app.make_response(func(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                response.add_etag()
+                cache.set(key, response.mimetype,
+                          response.get_etag()[0], response.get_data())
+            response.headers['X-Cache'] = 'MISS'
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return cached_decorator
+
+
+@lru_cache(maxsize=None)
+def cascades(metadata):
+    """
+    Maps every table to the tables whose rows are removed with its rows by
+    ON DELETE CASCADE foreign keys, transitively
+    """
+    children = {}
+    for table in metadata.tables.values():
+        for foreign_key in table.foreign_keys:
+            if (foreign_key.ondelete or '').upper() == 'CASCADE':
+                children.setdefault(foreign_key.column.table.name,
+                                    set()).add(table.name)
+    result = {}
+    for name in metadata.tables:
+        pending, found = list(children.get(name, ())), set()
+        while pending:
+            child = pending.pop()
+            if child not in found:
+                found.add(child)
+                pending.extend(children.get(child, ()))
+        result[name] = found
+    return result
+
+
+def init_response_cache(app):
+    """
+    Sets up the response cache of app from its RESPONSE_CACHE,
+    RESPONSE_CACHE_SIZE and RESPONSE_CACHE_TTL config values
+
+    :param app: flask app
+    :type app: Flask
+    """
+    backend = app.config.get('RESPONSE_CACHE', 'off')
+    if backend == 'off':
+        app.extensions['response_cache'] = None
+        return
+    if backend == 'local':
+        client = LocalClient(app.config.get('RESPONSE_CACHE_SIZE', 512))
+    elif backend.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        client = redis.Redis.from_url(backend)
+    else:
+        raise ValueError("Invalid value '{}' for RESPONSE_CACHE, acceptable "
+                         "values are off/local/redis://".format(backend))
+    app.extensions['response_cache'] = ResponseCache(
+        client, app.config.get('RESPONSE_CACHE_TTL', 300))
+
+
+def session_cache(session):
+    app = getattr(session, 'app', None)
+    if app is None:
+        return None
+    return app.extensions.get('response_cache')
+
+
+@event.listens_for(Session, 'after_begin')
+def track_writes(session, transaction, connection):
+    # statements reach the engine without their session, the connection
+    # carries the set of tables its session wrote to
+    if session_cache(session) is not None:
+        connection.info['written_tables'] = session.info.setdefault(
+            'written_tables', set())
+
+
+@event.listens_for(Engine, 'after_execute')
+def record_write(conn, clauseelement, multiparams, params, result):
+    # sees flushes, bulk query updates/deletes and core statements alike
+    written = conn.info.get('written_tables')
+    if written is not None and isinstance(clauseelement, UpdateBase):
+        table = clauseelement.table
+        written.add(table.name)
+        if isinstance(clauseelement, Delete):
+            written.update(cascades(table.metadata)[table.name])
+
+
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+def untrack_writes(conn):
+    conn.info.pop('written_tables', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_written(session):
+    written = session.info.pop('written_tables', None)
+    cache = session_cache(session)
+    if not written or cache is None:
+        return
+    cache.invalidate(written)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_written(session):
+    session.info.pop('written_tables', None)
@@ -0,0 +1,169 @@
+"""
+Slow query log: statements running longer than SLOW_QUERY_MS are recorded
+with their bound parameters and the endpoint that ran them, and logged as
+warnings. The latest SLOW_QUERY_LOG_SIZE records of each worker are kept
+in memory and served by the /admin/slow-queries route.
+
+With SLOW_QUERY_EXPLAIN on, slow SELECT statements are run again under
+EXPLAIN (ANALYZE, BUFFERS), in a savepoint of the same transaction, and
+the plan is recorded with them. This doubles the cost of every slow
+select, leave it off unless investigating.
+"""
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+
+logger = logging.getLogger(__name__)
+
+MAX_PARAMETER_ROWS = 10
+
+
+def bound_parameters(parameters):
+    """
+    Converts the parameters of a statement to json serializable values,
+    keeping the first MAX_PARAMETER_ROWS rows of an executemany
+    """
+    if isinstance(parameters, dict):
+        return {name: bound_parameters(value)
+                for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [bound_parameters(value)
+                for value in parameters[:MAX_PARAMETER_ROWS]]
+    if parameters is None or isinstance(parameters, (str, int, float, bool)):
+        return parameters
+    return str(parameters)
+
+
+def explain(conn, statement, parameters):
+    """
+    Returns the EXPLAIN (ANALYZE, BUFFERS) plan of a select, None when it
+    cannot be explained. Runs in a savepoint, a failure leaves the
+    transaction of conn usable.
+    """
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement,
+                           parameters)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception:
+            cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            logger.warning("Could not explain slow query", exc_info=True)
+            return None
+        finally:
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    except Exception:
+        logger.warning("Could not explain slow query", exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    """
+    Bounded log of the statements slower than threshold
+
+    :param threshold: seconds above which a statement is recorded
+    :type threshold: float
+    :param size: number of records kept, the oldest are dropped first
+    :type size: int
+    :param explain: record the plans of slow selects, postgres only
+    :type explain: bool
+    """
+
+    def __init__(self, threshold, size=100, explain=False):
+        self.threshold = threshold
+        self.explain = explain
+        self._records = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._engines = weakref.WeakSet()
+
+    def attach(self, engine):
+        """
+        Times the statements run by engine, once per engine
+        """
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', self.start)
+        event.listen(engine, 'after_cursor_execute', self.end)
+        event.listen(engine, 'handle_error', self.failed)
+
+    def start(self, conn, cursor, statement, parameters, context,
+              executemany):
+        conn.info.setdefault('slow_query_started', []).append(
+            time.perf_counter())
+
+    def end(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('slow_query_started')
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        if seconds < self.threshold:
+            return
+        record = {
+            'statement': statement,
+            'parameters': bound_parameters(parameters),
+            'duration_ms': round(seconds * 1000, 2),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'plan': None
+        }
+        if (self.explain and not executemany and
+                conn.dialect.name == 'postgresql' and
+                statement.lstrip()[:6].upper() == 'SELECT'):
+            record['plan'] = explain(conn, statement, parameters)
+        logger.warning("Slow query (%.2f ms) from %s: %s",
+                       record['duration_ms'], record['endpoint'], statement)
+        with self._lock:
+            self._records.append(record)
+
+    def failed(self, context):
+        if context.connection is not None:
+            started = context.connection.info.get('slow_query_started')
+            if started:
+                started.pop()
+
+    def records(self):
+        """
+        Returns the recorded statements, the slowest first
+        """
+        with self._lock:
+            records = list(self._records)
+        return sorted(records, key=lambda record: record['duration_ms'],
+                      reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+def init_slow_query_log(app, engine):
+    """
+    Records the slow statements of engine when the SLOW_QUERY_MS config
+    value of app is set, sized by SLOW_QUERY_LOG_SIZE and explained when
+    SLOW_QUERY_EXPLAIN is on
+
+    :param app: flask app
+    :type app: Flask
+    :param engine: engine of the app's database
+    :type engine: Engine
+    """
+    threshold = app.config.get('SLOW_QUERY_MS')
+    if threshold is None:
+        return
+    log = app.extensions.get('slow_queries')
+    if log is None:
+        log = SlowQueryLog(threshold / 1000,
+                           app.config.get('SLOW_QUERY_LOG_SIZE', 100),
+                           app.config.get('SLOW_QUERY_EXPLAIN', False))
+        app.extensions['slow_queries'] = log
+    log.attach(engine)
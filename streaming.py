@@ -0,0 +1,66 @@
+from itertools import islice
+
+from flask import Response, abort, stream_with_context
+
+from json_encoding import encoder
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json'
+}
+
+
+def export_response(query, key, serialize, export_format='ndjson',
+                    batch_size=1000):
+    """
+    Streams every row of query without building the result in memory.
+
+    Rows are read through a server-side cursor `batch_size` at a time and
+    sent as one chunk of pre-encoded bytes per batch, either as newline
+    delimited json or as a single json document shaped like the list
+    endpoints.
+
+    :param query: query of the rows to export
+    :type query: Query
+    :param key: name of the list in the json document
+    :type key: str
+    :param serialize: returns the json serializable form of a row
+    :type serialize: callable
+    :param export_format: ndjson or json
+    :type export_format: str
+    :param batch_size: rows fetched and sent per chunk
+    :type batch_size: int
+    :return: streamed response
+    :rtype: Response
+    """
+    if export_format not in EXPORT_FORMATS:
+        abort(400, "Invalid value '{}' for format, acceptable values are "
+                   "{}".format(export_format, '/'.join(EXPORT_FORMATS)))
+    rows = iter(query.execution_options(stream_results=True).yield_per(
+        batch_size))
+    dumps = encoder()
+
+    def batches():
+        while True:
+            batch = [serialize(row) for row in islice(rows, batch_size)]
+            if not batch:
+                return
+            yield batch
+
+    def generate_ndjson():
+        for batch in batches():
+            yield b'\n'.join(map(dumps, batch)) + b'\n'
+
+    def generate_json():
+        # each batch is encoded as one array, without its brackets
+        yield b'{"success":true,"' + key.encode('utf-8') + b'":['
+        separator = b''
+        for batch in batches():
+            yield separator + dumps(batch)[1:-1]
+            separator = b','
+        yield b']}\n'
+
+    generate = generate_ndjson if export_format == 'ndjson' else generate_json
+    return Response(stream_with_context(generate()),
+                    mimetype=EXPORT_FORMATS[export_format])
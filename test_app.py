@@ -1,7 +1,20 @@
+import gzip
+import os
+import pstats
+import tempfile
+import time
 import unittest
 import json
+from contextlib import contextmanager
+from datetime import date, timedelta
+from sqlalchemy import event
 
 from app import create_app
+from auth.auth import token_cache
+from instrumentation import add_timing_observer
+from json_encoding import encoder, init_json, orjson
+from metrics import Metrics, MmapValues
+from response_cache import LocalClient, init_response_cache
 from model import *
 import jwt
 
@@ -250,6 +263,21 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(data['message'], "Invalid value '{}' for Int() age "
                                           "field".format(age))
 
+    def test_create_and_update_share_field_rules(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        actor = self.get_actor()
+        body = {"name": 12, "age": 30, "gender": "male",
+                "nationality": "Nigeria"}
+        for method, url in (('post', '/actors'),
+                            ('patch', '/actors/{}'.format(actor.id))):
+            res = getattr(self.client(), method)(url, json=body,
+                                                 headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], "Invalid value for 'name' "
+                                              "field, expected a string")
+
     def test_create_actor_wrong_auth(self):
         headers = {"Authorization": "Bearer {}".format(
             jwt.casting_assistance)}
@@ -364,6 +392,218 @@ class AppTestCase(unittest.TestCase):
         }, headers=headers)
         self.assertEqual(res.status_code, 403)
 
+    def test_create_actors_bulk(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_director)}
+        actor = {"name": "Bulk", "age": 30, "gender": "male",
+                 "nationality": "Nigeria"}
+        with self.count_queries() as statements:
+            res = self.client().post('/actors/bulk', json=[
+                actor,
+                dict(actor, gender="other"),
+                dict(actor, age=-1),
+                dict(actor, name="Bulk 2"),
+                "actor"
+            ], headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(statements), 1)
+        self.assertFalse(data['success'])
+        self.assertEqual([index for index, record_id in enumerate(data['ids'])
+                          if record_id], [0, 3])
+        self.assertEqual(data['errors'], [
+            {"index": 1, "message": "Invalid value 'other' for gender, "
+                                    "acceptable values are male/female"},
+            {"index": 2, "message": "Invalid value '-1' for Int() age field"},
+            {"index": 4, "message": "Expected a json object"}
+        ])
+        with self.app.app_context():
+            names = [db.session.query(Actors).get(record_id).name
+                     for record_id in data['ids'] if record_id]
+        self.assertEqual(names, ["Bulk", "Bulk 2"])
+
+    def test_create_movies_bulk(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        res = self.client().post('/movies/bulk', json=[
+            {"title": "Bulk", "description": "Bulk",
+             "release_date": "2020/1/4"},
+            {"title": "Bulk", "description": "Bulk",
+             "release_date": "2020-1-4"},
+            {"description": "Bulk", "release_date": "2020/1/4"}
+        ], headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['errors'], [
+            {"index": 1, "message": "Error in release date field format"},
+            {"index": 2, "message": "Missing value for 'title' field"}
+        ])
+        with self.app.app_context():
+            movie = db.session.query(Movies).get(data['ids'][0])
+            self.assertEqual(movie.get_date_format(), "Sat Jan 04 2020")
+
+        movies = [{"title": title, "description": "Bulk",
+                   "release_date": "2020/1/{}".format(day)}
+                  for day, title in enumerate("CABBA", 1)]
+        movies.append(dict(movies[1]))
+        res = self.client().post('/movies/bulk', json=movies,
+                                 headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(set(data['ids'])), len(movies))
+        with self.app.app_context():
+            created = [db.session.query(Movies).get(record_id)
+                       for record_id in data['ids']]
+            self.assertEqual([(movie.title, movie.release_date.day)
+                              for movie in created],
+                             [("C", 1), ("A", 2), ("B", 3), ("B", 4),
+                              ("A", 5), ("A", 2)])
+
+    def test_create_bulk_column_limits(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        actor = {"name": "Bulk", "age": 30, "gender": "male",
+                 "nationality": "Nigeria"}
+        res = self.client().post('/actors/bulk', json=[
+            dict(actor, name="n" * 151),
+            dict(actor, age=99999999999),
+            dict(actor, nationality="n" * 150)
+        ], headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['ids'][:2], [None, None])
+        self.assertIsNotNone(data['ids'][2])
+        self.assertEqual(data['errors'], [
+            {"index": 0, "message": "Invalid value for 'name' field, "
+                                    "expected at most 150 characters"},
+            {"index": 1, "message": "Invalid value '99999999999' for Int() "
+                                    "age field"}
+        ])
+
+        res = self.client().post('/movies/bulk', json=[
+            {"title": "Bulk", "description": "d" * 501,
+             "release_date": "2020/1/4"}
+        ], headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['errors'], [
+            {"index": 0, "message": "Invalid value for 'description' field, "
+                                    "expected at most 500 characters"}
+        ])
+
+    def test_create_casts_bulk(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        other = self.add_movie("Bulk")
+        self.add_filmography(self.get_actor().id, [movie.id])
+        with self.count_queries() as statements:
+            res = self.client().post('/casts/bulk', json=[
+                {"movie_id": other.id},
+                {"movie_id": other.id},
+                {"movie_id": movie.id},
+                {"movie_id": 100000000},
+                {"movie_id": "one"}
+            ], headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(statements), 2)
+        self.assertIsNotNone(data['ids'][0])
+        self.assertEqual(data['ids'][1:], [None] * 4)
+        invalid = "Movie id is invalid, please enter a valid Movie id"
+        self.assertEqual(data['errors'], [
+            {"index": 1, "message": "Duplicate key Violation, Movie id {} "
+                                    "already assigned to a cast".format(
+                                        other.id)},
+            {"index": 2, "message": "Duplicate key Violation, Movie id {} "
+                                    "already assigned to a cast".format(
+                                        movie.id)},
+            {"index": 3, "message": invalid},
+            {"index": 4, "message": invalid}
+        ])
+
+    def test_create_stars_bulk(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        actor = self.get_actor()
+        self.add_filmography(actor.id, [movie.id])
+        cast = self.get_cast()
+        with self.app.app_context():
+            other_id = db.session.query(Actors).filter(
+                Actors.name == "Michelle Forbes").first().id
+        with self.count_queries() as statements:
+            res = self.client().post('/stars/bulk', json=[
+                {"cast_id": cast.id, "actor_id": other_id},
+                {"cast_id": cast.id, "actor_id": other_id},
+                {"cast_id": cast.id, "actor_id": actor.id},
+                {"cast_id": cast.id, "actor_id": 100000000},
+                {"cast_id": 100000000, "actor_id": other_id}
+            ], headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(data['errors'], [
+            {"index": 1, "message": "Actor is already assigned to Cast"},
+            {"index": 2, "message": "Actor is already assigned to Cast"},
+            {"index": 3, "message": "Actor id does not exist"},
+            {"index": 4, "message": "Cast id does not exist"}
+        ])
+        stars = self.get_stars()
+        self.assertEqual(len(stars), 2)
+        self.assertIn(data['ids'][0], [star.id for star in stars])
+
+    def test_negative_create_bulk(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        self.app.config['MAX_BULK_SIZE'] = 1
+        cases = [
+            ({"movie_id": 1}, "Expected a non-empty json array"),
+            ([], "Expected a non-empty json array"),
+            ([{"movie_id": 1}, {"movie_id": 2}],
+             "At most 1 items can be created at once")
+        ]
+        for body, message in cases:
+            res = self.client().post('/casts/bulk', json=body,
+                                     headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], message)
+
+        res = self.client().post('/casts/bulk', json=[{
+            "movie_id": 100000000
+        }], headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['ids'], [None])
+
+    def test_create_cast_and_star_not_object(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        for route in ('/casts', '/stars'):
+            for body in ([{"movie_id": 1}], "cast", 1):
+                res = self.client().post(route, json=body, headers=headers)
+                data = json.loads(res.data)
+                self.assertEqual(res.status_code, 400, (route, body))
+                self.assertEqual(data['message'], "Expected a json object")
+            res = self.client().post(route + '/bulk', json=[[1], "cast"],
+                                     headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['errors'], [
+                {"index": 0, "message": "Expected a json object"},
+                {"index": 1, "message": "Expected a json object"}
+            ])
+
+    def test_create_bulk_wrong_auth(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().post('/actors/bulk', json=[{
+            "name": "Bulk", "age": 30, "gender": "male",
+            "nationality": "Nigeria"
+        }], headers=headers)
+        self.assertEqual(res.status_code, 403)
+
     def test_delete_actor_record(self):
         headers = {"Authorization": "Bearer {}".format(
             jwt.casting_director)}
@@ -572,6 +812,128 @@ class AppTestCase(unittest.TestCase):
                                    headers=headers)
         self.assertEqual(res.status_code, 403)
 
+    def test_get_actors_pages(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        names = []
+        cursor = None
+        for _ in range(3):
+            url = '/actors?limit=1'
+            if cursor is not None:
+                url += '&after={}'.format(cursor)
+            res = self.client().get(url, headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            names += [actor['name'] for actor in data['actors']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertIsNone(cursor)
+        self.assertEqual(names, ["Jeremy Irvine", "Michelle Forbes"])
+
+    def test_get_movies_page_size_is_capped(self):
+        self.app.config['MAX_PAGE_SIZE'] = 1
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/movies?limit=50', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['movies']), 1)
+        self.assertEqual(data['next_cursor'], data['movies'][0]['id'])
+
+    def test_get_movies_invalid_page_arguments(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        for query in ('limit=0', 'limit=ten', 'after=first'):
+            res = self.client().get('/movies?{}'.format(query),
+                                    headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    def test_get_actors_by_ids(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        with self.app.app_context():
+            ids = [actor.id for actor in db.session.query(Actors).order_by(
+                Actors.id.desc())]
+        with self.count_queries() as statements:
+            res = self.client().get('/actors?ids={},100000000,{},{}'.format(
+                ids[0], ids[1], ids[0]), headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual([actor['id'] for actor in data['actors']], ids)
+        self.assertEqual(data['missing'], [100000000])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_get_stars_by_ids(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        self.add_filmography(self.get_actor().id, [self.get_movie().id])
+        star = self.get_stars()[0]
+        res = self.client().get('/stars?ids={}'.format(star.id),
+                                headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['stars'], [{
+            "id": star.id,
+            "cast_id": star.cast_id,
+            "actor_id": star.actor_id
+        }])
+        self.assertEqual(data['missing'], [])
+
+    def test_get_movies_invalid_ids(self):
+        self.app.config['MAX_PAGE_SIZE'] = 2
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        for query in ('ids=', 'ids=1,two', 'ids=0', 'ids=1,2,3'):
+            res = self.client().get('/movies?{}'.format(query),
+                                    headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+        # the cap is hit before the rest of the list is read
+        res = self.client().get('/movies?ids=1,2,3,x', headers=headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('At most 2 ids', json.loads(res.data)['message'])
+        # repeated ids do not count towards the cap
+        res = self.client().get('/movies?ids=1,2,1,2', headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+    def test_export_actors_ndjson(self):
+        self.app.config['EXPORT_BATCH_SIZE'] = 1
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/export/actors', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        actors = [json.loads(line) for line in res.data.splitlines()]
+        self.assertEqual([actor['name'] for actor in actors],
+                         ["Jeremy Irvine", "Michelle Forbes"])
+
+    def test_export_movies_json(self):
+        self.app.config['EXPORT_BATCH_SIZE'] = 1
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/export/movies?format=json',
+                                headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([movie['title'] for movie in data['movies']],
+                         ["Treadstone", "Rise of Skywalker"])
+
+        res = self.client().get('/export/movies?format=xml', headers=headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_stars_wrong_auth(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/export/stars', headers=headers)
+        self.assertEqual(res.status_code, 403)
+
     def test_get_actor_by_nationality(self):
         nationality = "United States"
         headers = {"Authorization": "Bearer {}".format(
@@ -610,6 +972,46 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['movies'], ['Treadstone'])
 
+    def test_get_all_movies_with_an_actor_full_records(self):
+        movie = self.get_movie()
+        actor = self.get_actor()
+        self.add_filmography(actor.id, [movie.id])
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/actors/{}/movies?full=true'.format(
+            actor.id), headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movies'][0]['id'], movie.id)
+        self.assertEqual(data['movies'][0]['release_date'], 'Sat Jan 04 2020')
+
+    def test_get_all_movies_with_an_actor_does_not_exist(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/actors/100000000/movies', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], "Actor id does not exist")
+
+    def test_get_all_movies_with_an_actor_query_count(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        actor = self.get_actor()
+        counts = []
+        for size in (0, 1, 20):
+            self.add_filmography(actor.id, [
+                self.add_movie("Filmography {} {}".format(size, i)).id
+                for i in range(size)])
+            for full in ('false', 'true'):
+                with self.count_queries() as statements:
+                    res = self.client().get(
+                        '/actors/{}/movies?full={}'.format(actor.id, full),
+                        headers=headers)
+                self.assertEqual(res.status_code, 200)
+                counts.append(len(statements))
+        self.assertEqual(len(json.loads(res.data)['movies']), 21)
+        self.assertEqual(counts, [1] * len(counts))
+
     def test_get_all_actors_in_a_movie(self):
         headers = {"Authorization": "Bearer {}".format(
             jwt.executive_producer)}
@@ -639,6 +1041,63 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(data['movie'], 'Treadstone')
         self.assertEqual(data['casts'], ['Jeremy Irvine'])
 
+    def test_get_all_actors_in_a_movie_full_records(self):
+        movie = self.get_movie()
+        actor = self.get_actor()
+        self.add_filmography(actor.id, [movie.id])
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/movies/{}/cast?full=true'.format(movie.id),
+                                headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movie'], 'Treadstone')
+        self.assertEqual(data['casts'], [actor.format()])
+
+    def test_get_all_actors_in_a_movie_without_cast(self):
+        movie = self.get_movie()
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/movies/{}/cast'.format(movie.id),
+                                headers=headers)
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client().get('/movies/100000000/cast', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], "Movie id does not exist")
+
+    def test_get_all_actors_in_a_movie_query_count(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        movie = self.get_movie()
+        with self.app.app_context():
+            cast = Casts(movie_id=movie.id)
+            db.session.add(cast)
+            db.session.commit()
+            cast_id = cast.id
+        counts = []
+        for size in (0, 1, 20):
+            with self.app.app_context():
+                for i in range(size):
+                    actor = Actors(name="Ensemble {} {}".format(size, i),
+                                   age=30, gender="female",
+                                   nationality="Nigeria")
+                    db.session.add(actor)
+                    db.session.flush()
+                    db.session.add(Starring(cast_id=cast_id,
+                                            actor_id=actor.id))
+                db.session.commit()
+            for full in ('false', 'true'):
+                with self.count_queries() as statements:
+                    res = self.client().get(
+                        '/movies/{}/cast?full={}'.format(movie.id, full),
+                        headers=headers)
+                self.assertEqual(res.status_code, 200)
+                counts.append(len(statements))
+        self.assertEqual(len(json.loads(res.data)['casts']), 21)
+        self.assertEqual(counts, [1] * len(counts))
+
     def test_update_actor(self):
         headers = {"Authorization": "Bearer {}".format(
             jwt.casting_director)}
@@ -679,6 +1138,60 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 400)
         self.assertEqual(data['message'], "Actor id does not exist")
 
+    def test_negative_partial_update_actor(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        actor = self.get_actor()
+        cases = [
+            ({"age": None}, "Invalid value 'None' for Int() age field"),
+            ({"age": [1]}, "Invalid value '[1]' for Int() age field"),
+            ({"age": -5}, "Invalid value '-5' for Int() age field"),
+            ({"age": True}, "Invalid value 'True' for Int() age field"),
+            ({"age": 3.7}, "Invalid value '3.7' for Int() age field"),
+            ({"age": "12"}, "Invalid value '12' for Int() age field"),
+            ({"age": 99999999999}, "Invalid value '99999999999' for Int() "
+                                   "age field"),
+            ({"name": "n" * 151}, "Invalid value for 'name' field, expected "
+                                  "at most 150 characters"),
+            ({"gender": None}, "Invalid value 'None' for gender, acceptable "
+                               "values are male/female"),
+            ({"name": None}, "Missing value for 'name' field"),
+            ({"nationality": None}, "Missing value for 'nationality' field"),
+            ({"name": 12}, "Invalid value for 'name' field, expected a "
+                           "string"),
+            (["age"], "Expected a json object")
+        ]
+        for body, message in cases:
+            res = self.client().patch('/actors/{}'.format(actor.id),
+                                      json=body, headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400, body)
+            self.assertEqual(data['message'], message)
+        self.assertEqual(self.get_actor().age, actor.age)
+
+    def test_negative_partial_update_movie_fields(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        cases = [
+            ({"title": None}, "Missing value for 'title' field"),
+            ({"description": ["hello"]}, "Invalid value for 'description' "
+                                         "field, expected a string"),
+            ({"release_date": None}, "Error in release date field format"),
+            ({"title": "t" * 151}, "Invalid value for 'title' field, "
+                                   "expected at most 150 characters"),
+            ({"description": "d" * 501}, "Invalid value for 'description' "
+                                         "field, expected at most 500 "
+                                         "characters")
+        ]
+        for body, message in cases:
+            res = self.client().patch('/movies/{}'.format(movie.id),
+                                      json=body, headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400, body)
+            self.assertEqual(data['message'], message)
+        self.assertEqual(self.get_movie().description, movie.description)
+
     def test_update_movie(self):
         headers = {"Authorization": "Bearer {}".format(
             jwt.casting_director)}
@@ -714,6 +1227,39 @@ class AppTestCase(unittest.TestCase):
         }, headers=headers)
         self.assertEqual(res.status_code, 400)
 
+    def test_partial_update_movie(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_director)}
+        movie = self.get_movie()
+        with self.count_queries() as statements:
+            res = self.client().patch('/movies/{}'.format(movie.id), json={
+                "description": "Only the description"
+            }, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(statements), 1)
+        updated = self.get_movie()
+        self.assertEqual(updated.title, movie.title)
+        self.assertEqual(updated.release_date, movie.release_date)
+        self.assertEqual(updated.description, "Only the description")
+
+        res = self.client().patch('/movies/{}'.format(movie.id), json={},
+                                  headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], "No fields to update")
+
+    def test_negative_partial_update_movie(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_director)}
+        with self.count_queries() as statements:
+            res = self.client().patch('/movies/100000000', json={
+                "title": "Unknown"
+            }, headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], "Movie id does not exist")
+        self.assertEqual(len(statements), 1)
+
     def test_update_cast(self):
         headers = {"Authorization": "Bearer {}".format(
             jwt.executive_producer)}
@@ -777,6 +1323,606 @@ class AppTestCase(unittest.TestCase):
         }, headers=headers)
         self.assertEqual(res.status_code, 400)
 
+    def test_create_star_query_count(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        actor = self.get_actor()
+        with self.app.app_context():
+            cast = Casts(movie_id=movie.id)
+            db.session.add(cast)
+            db.session.commit()
+            cast_id = cast.id
+        for status in (201, 400):
+            with self.count_queries() as statements:
+                res = self.client().post('/stars', json={
+                    "cast_id": cast_id,
+                    "actor_id": actor.id
+                }, headers=headers)
+            self.assertEqual(res.status_code, status)
+            self.assertEqual(len(statements), 1)
+
+    def test_update_star(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        actor = self.get_actor()
+        self.add_filmography(actor.id, [movie.id])
+        star = self.get_stars()[0]
+        with self.app.app_context():
+            other = db.session.query(Actors).filter(
+                Actors.name == "Michelle Forbes").first()
+            other_id = other.id
+
+        res = self.client().patch('/stars/{}'.format(star.id), json={
+            "cast_id": star.cast_id,
+            "actor_id": other_id
+        }, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.get_stars()[0].actor_id, other_id)
+
+    def test_negative_update_star(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        actor = self.get_actor()
+        self.add_filmography(actor.id, [movie.id])
+        with self.app.app_context():
+            other = db.session.query(Actors).filter(
+                Actors.name == "Michelle Forbes").first()
+            db.session.add(Starring(cast_id=self.get_cast().id,
+                                    actor_id=other.id))
+            db.session.commit()
+            other_id = other.id
+        star = self.get_stars()[0]
+
+        cases = [
+            (star.id, star.cast_id, other_id,
+             "Actor is already assigned to Cast"),
+            (star.id, star.cast_id, 100000000, "Actor id does not exist"),
+            (star.id, 100000000, other_id, "Cast id does not exist"),
+            (100000000, star.cast_id, other_id, "Star id does not exist")
+        ]
+        for star_id, cast_id, actor_id, message in cases:
+            res = self.client().patch('/stars/{}'.format(star_id), json={
+                "cast_id": cast_id,
+                "actor_id": actor_id
+            }, headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], message)
+
+    def test_delete_query_count(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        actor = self.get_actor()
+        movie_ids = []
+        for size in (1, 20):
+            ids = [self.add_movie("Fan-out {} {}".format(size, i)).id
+                   for i in range(size)]
+            self.add_filmography(actor.id, ids)
+            movie_ids.append(ids[0])
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Starring).count(), 21)
+
+        counts = []
+        for url in ('/movies/{}'.format(movie_ids[0]),
+                    '/movies/{}'.format(movie_ids[1]),
+                    '/actors/{}'.format(actor.id)):
+            with self.count_queries() as statements:
+                res = self.client().delete(url, headers=headers)
+            self.assertEqual(res.status_code, 204)
+            counts.append(len(statements))
+        self.assertEqual(counts, [1, 1, 1])
+        self.assertFalse(self.get_stars())
+
+    def test_delete_record_does_not_exist(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        for resource, label in (('movies', 'Movie'), ('actors', 'Actor'),
+                                ('casts', 'Cast'), ('stars', 'Star')):
+            res = self.client().delete('/{}/100000000'.format(resource),
+                                       headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'],
+                             "{} id does not exist".format(label))
+
+    def test_write_query_count(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        actor = self.get_actor()
+        with self.count_queries() as statements:
+            res = self.client().post('/casts', json={
+                "movie_id": movie.id
+            }, headers=headers)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(len(statements), 1)
+
+        cast = self.get_cast()
+        with self.app.app_context():
+            new_movie = db.session.query(Movies).filter(
+                Movies.title == "Rise of Skywalker").first()
+        requests = [
+            ('/casts/{}'.format(cast.id), {"movie_id": new_movie.id}),
+            ('/actors/{}'.format(actor.id), {
+                "age": actor.age,
+                "gender": actor.gender,
+                "name": actor.name,
+                "nationality": "Nigeria"
+            })
+        ]
+        for url, body in requests:
+            with self.count_queries() as statements:
+                res = self.client().patch(url, json=body, headers=headers)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(statements), 1)
+
+    def enable_response_cache(self):
+        self.app.config['RESPONSE_CACHE'] = 'local'
+        init_response_cache(self.app)
+        return self.app.extensions['response_cache']
+
+    def test_response_cache(self):
+        cache = self.enable_response_cache()
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        res = self.client().get('/movies', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        with self.count_queries() as statements:
+            cached = self.client().get('/movies', headers=headers)
+        self.assertEqual(cached.headers['X-Cache'], 'HIT')
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(cached.mimetype, 'application/json')
+        self.assertEqual(len(statements), 0)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+        # a write to another table keeps the entry
+        for _ in range(2):
+            res = self.client().get('/actors', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        res = self.client().post('/actors', json={
+            "name": "Cached", "age": 30, "gender": "male",
+            "nationality": "Nigeria"
+        }, headers=headers)
+        self.assertEqual(res.status_code, 201)
+        res = self.client().get('/movies', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        res = self.client().get('/actors', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+
+        res = self.client().patch('/movies/{}'.format(movie.id), json={
+            "title": "Treadstone 2"
+        }, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/movies', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn("Treadstone 2",
+                      [movie['title'] for movie in data['movies']])
+
+    def test_response_cache_invalidates_cascaded_tables(self):
+        self.enable_response_cache()
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        self.add_filmography(self.get_actor().id, [movie.id])
+        for _ in range(2):
+            res = self.client().get('/stars', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.assertEqual(len(json.loads(res.data)['stars']), 1)
+
+        res = self.client().delete('/movies/{}'.format(movie.id),
+                                   headers=headers)
+        self.assertEqual(res.status_code, 204)
+        res = self.client().get('/stars', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(res.data)['stars'], [])
+
+    def test_response_cache_scope(self):
+        self.enable_response_cache()
+        res = self.client().get('/actors', headers={
+            "Authorization": "Bearer {}".format(jwt.casting_assistance)})
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client().get('/actors', headers={
+            "Authorization": "Bearer {}".format(jwt.casting_director)})
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client().get('/actors?limit=1', headers={
+            "Authorization": "Bearer {}".format(jwt.casting_director)})
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client().get('/casts', headers={
+            "Authorization": "Bearer {}".format(jwt.casting_assistance)})
+        self.assertEqual(res.status_code, 403)
+
+    def test_response_cache_ignores_rollbacks(self):
+        self.enable_response_cache()
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        for _ in range(2):
+            res = self.client().get('/casts', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        res = self.client().post('/casts', json={
+            "movie_id": 100000000
+        }, headers=headers)
+        self.assertEqual(res.status_code, 400)
+        res = self.client().get('/casts', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        res = self.client().get('/casts/100000000', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+
+    def test_conditional_get(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        res = self.client().get('/movies', headers=headers)
+        etag = res.headers['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        res = self.client().get('/movies', headers=dict(
+            headers, **{"If-None-Match": etag}))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers['ETag'], etag)
+
+        res = self.client().patch('/movies/{}'.format(movie.id), json={
+            "title": "Treadstone 2"
+        }, headers=headers)
+        res = self.client().get('/movies', headers=dict(
+            headers, **{"If-None-Match": etag}))
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+        res = self.client().get('/movies/100000000/cast', headers=headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertNotIn('ETag', res.headers)
+
+    def test_conditional_get_from_cache(self):
+        self.enable_response_cache()
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        res = self.client().get('/actors', headers=headers)
+        etag = res.headers['ETag']
+        with self.count_queries() as statements:
+            res = self.client().get('/actors', headers=dict(
+                headers, **{"If-None-Match": etag}))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.assertEqual(len(statements), 0)
+
+    def test_local_client(self):
+        now = [1000]
+        client = LocalClient(max_entries=2, clock=lambda: now[0])
+        client.set('a', b'1', ex=10)
+        client.set('b', b'2')
+        client.get('a')
+        client.set('c', b'3')
+        self.assertEqual((client.get('a'), client.get('b'), client.get('c')),
+                         (b'1', None, b'3'))
+        now[0] += 10
+        self.assertIsNone(client.get('a'))
+        self.assertEqual(client.mget(['version:movies']), [None])
+        self.assertTrue(client.set('version:movies', 5, nx=True))
+        self.assertIsNone(client.set('version:movies', 1, nx=True))
+        self.assertEqual(client.incr('version:movies'), 6)
+
+    def test_gzip_response(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        plain = self.client().get('/movies', headers=headers)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+        res = self.client().get('/movies', headers=dict(
+            headers, **{"Accept-Encoding": "gzip"}))
+        self.assertNotIn('Content-Encoding', res.headers)
+
+        self.app.config['COMPRESS_MIN_SIZE'] = 1
+        res = self.client().get('/movies', headers=dict(
+            headers, **{"Accept-Encoding": "gzip, deflate"}))
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(int(res.headers['Content-Length']), len(res.data))
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+        etag = res.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        res = self.client().get('/movies', headers=dict(
+            headers, **{"Accept-Encoding": "gzip", "If-None-Match": etag}))
+        self.assertEqual(res.status_code, 304)
+        for accept_encoding in ("gzip;q=0", "identity"):
+            res = self.client().get('/movies', headers=dict(
+                headers, **{"Accept-Encoding": accept_encoding}))
+            self.assertNotIn('Content-Encoding', res.headers)
+            self.assertEqual(res.data, plain.data)
+
+    def test_gzip_streamed_export(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        plain = self.client().get('/export/actors', headers=headers)
+        res = self.client().get('/export/actors', headers=dict(
+            headers, **{"Accept-Encoding": "gzip"}))
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', res.headers)
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+
+    def test_json_backends(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.casting_assistance)}
+        backends = ['stdlib'] + (['orjson'] if orjson else [])
+        bodies = []
+        for backend in backends:
+            self.app.config['JSON_BACKEND'] = backend
+            init_json(self.app)
+            with self.app.app_context():
+                self.assertEqual(
+                    encoder()({"release_date": date(2020, 1, 4), "b": 1}),
+                    b'{"b":1,"release_date":"2020-01-04"}')
+            res = self.client().get('/movies', headers=headers)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.mimetype, 'application/json')
+            bodies.append(res.data)
+        self.assertEqual(len(set(bodies)), 1)
+        titles = [movie['title'] for movie in json.loads(bodies[0])['movies']]
+        self.assertEqual(titles, ["Treadstone", "Rise of Skywalker"])
+
+        self.app.config['JSON_BACKEND'] = 'simplejson'
+        with self.assertRaises(ValueError):
+            init_json(self.app)
+
+    def test_format_date_matches_strftime(self):
+        day = date(1999, 12, 25)
+        while day < date(2001, 3, 5):
+            self.assertEqual(format_date(day), day.strftime("%a %b %d %Y"))
+            day += timedelta(days=1)
+        self.assertEqual(format_date(date(2020, 1, 4)), "Sat Jan 04 2020")
+
+    def test_server_timing(self):
+        timings = []
+        add_timing_observer(self.app, timings.append)
+        res = self.client().get('/movies', headers={
+            "Authorization": "Bearer {}".format(jwt.executive_producer)})
+        self.assertEqual(res.status_code, 200)
+        timing, = timings
+        self.assertEqual(timing.endpoint, 'get_movies')
+        self.assertEqual(timing.status, 200)
+        self.assertEqual(timing.query_count, 1)
+        self.assertTrue({'auth', 'db', 'serialize'} <= set(timing.phases))
+        metrics = [metric.split(';')[0] for metric
+                   in res.headers['Server-Timing'].split(', ')]
+        self.assertEqual(metrics[0], 'auth')
+        self.assertEqual(metrics[-3:], ['db', 'serialize', 'total'])
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+        self.assertIn(';desc="1 queries"', res.headers['Server-Timing'])
+
+        res = self.client().get('/movies')
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(timings[-1].query_count, 0)
+        self.assertNotIn('db', timings[-1].phases)
+
+        self.app.config['SERVER_TIMING'] = False
+        res = self.client().get('/movies', headers={
+            "Authorization": "Bearer {}".format(jwt.executive_producer)})
+        self.assertNotIn('Server-Timing', res.headers)
+        self.assertEqual(len(timings), 3)
+
+    def test_read_query_budgets(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        movie = self.get_movie()
+        actor = self.get_actor()
+        self.add_filmography(actor.id, [movie.id])
+        budgets = {
+            '/actors': 1,
+            '/actors/{}'.format(actor.id): 1,
+            '/actors/{}/movies'.format(actor.id): 1,
+            '/actors?ids={},{}'.format(actor.id, actor.id + 1000): 1,
+            '/movies': 1,
+            '/movies/{}'.format(movie.id): 1,
+            '/movies/{}/cast'.format(movie.id): 1,
+            '/casts': 1,
+            '/stars': 1
+        }
+        timings = []
+        add_timing_observer(self.app, timings.append)
+        for url, budget in budgets.items():
+            res = self.client().get(url, headers=headers)
+            self.assertEqual(res.status_code, 200, url)
+            self.assertLessEqual(timings[-1].query_count, budget, url)
+
+    def test_metrics(self):
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        for _ in range(2):
+            self.assertEqual(self.client().get(
+                '/movies', headers=headers).status_code, 200)
+        self.assertEqual(self.client().get('/movies').status_code, 401)
+
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        samples = {}
+        for line in res.get_data(as_text=True).splitlines():
+            if not line.startswith('#'):
+                key, value = line.rsplit(' ', 1)
+                samples[key] = float(value)
+        self.assertEqual(samples['http_requests_total{endpoint="get_movies",'
+                                 'method="GET",status="200"}'], 2)
+        self.assertEqual(samples['http_requests_total{endpoint="get_movies",'
+                                 'method="GET",status="401"}'], 1)
+        self.assertEqual(samples['http_request_duration_seconds_count{'
+                                 'endpoint="get_movies",method="GET"}'], 3)
+        self.assertEqual(samples['http_request_duration_seconds_bucket{'
+                                 'endpoint="get_movies",method="GET",'
+                                 'le="+Inf"}'], 3)
+        self.assertEqual(samples['db_queries_total{endpoint="get_movies"}'],
+                         2)
+        self.assertGreaterEqual(samples['cache_hits_total{cache="token"}'],
+                                1)
+        self.assertIn('cache_misses_total{cache="jwks"}', samples)
+        self.assertNotIn('cache_hits_total{cache="response"}', samples)
+
+    def test_metrics_creates_directory(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        directory = os.path.join(temporary.name, 'missing', 'metrics')
+        app = create_app({'METRICS_DIR': directory})
+        res = app.test_client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_metrics_sync_counter_reset(self):
+        metrics = Metrics()
+        labels = (('cache', 'token'),)
+        for total in (5, 7, 2, 3, 9):
+            metrics.sync('cache_hits_total', labels, total)
+        # 7 before the reset, then 9 since
+        self.assertEqual(metrics.collect()['cache_hits_total{cache="token"}'],
+                         16)
+
+    def test_metrics_aggregate_worker_files(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        directory = temporary.name
+        metrics = Metrics(directory)
+        metrics.inc('db_queries_total', (('endpoint', 'get_movies'),), 2)
+        metrics.observe('http_request_duration_seconds',
+                        (('endpoint', 'get_movies'), ('method', 'GET')), 0.02)
+
+        # another worker, its file grows past the initial size
+        other = MmapValues(os.path.join(directory, 'metrics_1.db'),
+                           initial_size=64)
+        other.inc('db_queries_total{endpoint="get_movies"}', 3)
+        for index in range(20):
+            other.inc('db_queries_total{{endpoint="e{}"}}'.format(index), 1)
+        self.assertEqual(MmapValues(other.path).items(), other.items())
+
+        totals = metrics.collect()
+        self.assertEqual(totals['db_queries_total{endpoint="get_movies"}'], 5)
+        self.assertEqual(totals['db_queries_total{endpoint="e19"}'], 1)
+        text = metrics.render()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        buckets = [line.split(' ')[1] for line in text.splitlines()
+                   if line.startswith('http_request_duration_seconds_bucket')]
+        self.assertEqual(buckets, ['0.0', '0.0', '1.0'] + ['1.0'] * 9)
+
+    def test_slow_query_log(self):
+        admin = {"Authorization": "Bearer slow-query-admin"}
+        token_cache.set('slow-query-admin', {
+            'exp': time.time() + 60,
+            'permissions': ['get:slow-queries']
+        })
+        res = self.client().get('/admin/slow-queries', headers=admin)
+        self.assertEqual(res.status_code, 404)
+
+        app = create_app({'SLOW_QUERY_MS': 0, 'SLOW_QUERY_EXPLAIN': True})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        movie = self.get_movie()
+        res = client.get('/movies/{}'.format(movie.id), headers={
+            "Authorization": "Bearer {}".format(jwt.executive_producer)})
+        self.assertEqual(res.status_code, 200)
+        res = client.get('/admin/slow-queries', headers={
+            "Authorization": "Bearer {}".format(jwt.executive_producer)})
+        self.assertEqual(res.status_code, 403)
+
+        res = client.get('/admin/slow-queries', headers=admin)
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data['threshold_ms'], 0)
+        record, = [record for record in data['slow_queries']
+                   if record['endpoint'] == 'get_movies_by_id']
+        self.assertIn('FROM movies', record['statement'])
+        self.assertIn(movie.id, record['parameters'].values())
+        self.assertIn('actual time', record['plan'])
+
+    def test_profile_requests(self):
+        admin = {"Authorization": "Bearer profile-admin"}
+        token_cache.set('profile-admin', {
+            'exp': time.time() + 60,
+            'permissions': ['post:profile']
+        })
+        headers = {"Authorization": "Bearer {}".format(
+            jwt.executive_producer)}
+        res = self.client().post('/admin/profile', json={}, headers=admin)
+        self.assertEqual(res.status_code, 404)
+
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        for profiler, extension in (('cprofile', '.pstats'),
+                                    ('sampler', '.collapsed')):
+            directory = os.path.join(temporary.name, profiler)
+            app = create_app({'PROFILE_DIR': directory,
+                              'PROFILER': profiler})
+            setup_db(app, self.database_path)
+            client = app.test_client()
+            for body in ({'requests': 0}, {'requests': 101},
+                         {'requests': True}, {'requests': '2'},
+                         {'requests': 1.5}, {'requests': None}):
+                res = client.post('/admin/profile', json=body, headers=admin)
+                self.assertEqual(res.status_code, 400)
+                self.assertIn("for requests, expected a number of requests "
+                              "between 1 and 100",
+                              json.loads(res.data)['message'])
+            res = client.post('/admin/profile', json={'endpoint': 'missing'},
+                              headers=admin)
+            self.assertEqual(res.status_code, 400)
+            res = client.post('/admin/profile', headers=headers, json={})
+            self.assertEqual(res.status_code, 403)
+
+            res = client.post('/admin/profile', json={
+                'requests': 2, 'endpoint': 'get_movies'}, headers=admin)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(json.loads(res.data)['profiler'], profiler)
+            client.get('/actors', headers=headers)
+            for _ in range(3):
+                client.get('/movies', headers=headers)
+            files = sorted(os.listdir(directory))
+            self.assertEqual(len(files), 2)
+            for name in files:
+                self.assertTrue(name.startswith('get_movies-'))
+                self.assertTrue(name.endswith(extension))
+        stats = pstats.Stats(*[os.path.join(temporary.name, 'cprofile', name)
+                               for name in os.listdir(os.path.join(
+                                   temporary.name, 'cprofile'))])
+        self.assertIn('get_movies', [function for _, _, function
+                                     in stats.stats])
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+        with self.app.app_context():
+            engine = db.engine
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+    def add_movie(self, title):
+        with self.app.app_context():
+            movie = Movies(title=title, description="Filmography test",
+                           release_date="2020/1/4")
+            db.session.add(movie)
+            db.session.commit()
+            db.session.refresh(movie)
+            db.session.expunge(movie)
+        return movie
+
+    def add_filmography(self, actor_id, movie_ids):
+        with self.app.app_context():
+            for movie_id in movie_ids:
+                cast = Casts(movie_id=movie_id)
+                db.session.add(cast)
+                db.session.flush()
+                db.session.add(Starring(cast_id=cast.id, actor_id=actor_id))
+            db.session.commit()
+
     def get_movie(self):
         with self.app.app_context():
             self.db = SQLAlchemy()
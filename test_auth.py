@@ -0,0 +1,194 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from auth.jwks import JWKSKeyStore
+from auth.token_cache import TokenCache
+
+
+def make_jwks(*kids):
+    return {'keys': [{
+        'kty': 'RSA',
+        'kid': kid,
+        'use': 'sig',
+        'n': 'sXchDaQebHnPiGvyDOAT4saGEUetSyo9MKLOoWFsueri23bOdgWp4Dy1Wl',
+        'e': 'AQAB'
+    } for kid in kids]}
+
+
+class JWKSStubServer:
+    """
+    Local stand-in for the Auth0 JWKS endpoint, counts fetches
+    """
+
+    def __init__(self, jwks, delay=0):
+        self.jwks = jwks
+        self.delay = delay
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                body = json.dumps(stub.jwks).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(
+            self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = JWKSStubServer(make_jwks('key-1'))
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_load_from_local_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                         delete=False) as jwks_file:
+            json.dump(make_jwks('key-1', 'key-2'), jwks_file)
+        self.addCleanup(os.remove, jwks_file.name)
+        store = JWKSKeyStore('file://' + jwks_file.name)
+        self.assertEqual('key-2', store.get_key('key-2')['kid'])
+        self.assertEqual('sig', store.get_key('key-1')['use'])
+
+    def test_keys_are_fetched_once(self):
+        store = JWKSKeyStore(self.stub.url)
+        for _ in range(10):
+            self.assertIsNotNone(store.get_key('key-1'))
+        self.assertEqual(1, self.stub.hits)
+
+    def test_unknown_kid_forces_single_refresh(self):
+        store = JWKSKeyStore(self.stub.url, min_refresh_interval=0)
+        store.get_key('key-1')
+        self.stub.jwks = make_jwks('key-1', 'key-2')
+        self.assertEqual('key-2', store.get_key('key-2')['kid'])
+        self.assertEqual(2, self.stub.hits)
+
+        self.assertIsNone(store.get_key('key-3'))
+        self.assertEqual(3, self.stub.hits)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        store = JWKSKeyStore(self.stub.url, min_refresh_interval=60)
+        store.get_key('key-1')
+        for _ in range(5):
+            self.assertIsNone(store.get_key('rotated'))
+        self.assertEqual(1, self.stub.hits)
+
+    def test_concurrent_misses_are_coalesced(self):
+        self.stub.delay = 0.2
+        store = JWKSKeyStore(self.stub.url, min_refresh_interval=0)
+        results = []
+
+        def lookup():
+            results.append(store.get_key('key-1'))
+
+        threads = [threading.Thread(target=lookup) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(10, len(results))
+        self.assertTrue(all(results))
+        self.assertEqual(1, self.stub.hits)
+
+    def test_expired_keys_refresh_in_background(self):
+        store = JWKSKeyStore(self.stub.url, ttl=0)
+        store.get_key('key-1')
+        self.stub.delay = 0.2
+        self.stub.jwks = make_jwks('key-2')
+
+        # stale key is served while the refresh runs
+        self.assertEqual('key-1', store.get_key('key-1')['kid'])
+        deadline = time.time() + 5
+        while store.fetch_count < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        with store._background_lock:
+            pass
+        self.assertEqual('key-2', store.get_key('key-2')['kid'])
+        self.assertLessEqual(self.stub.hits, 3)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000
+        self.cache = TokenCache(max_entries=2, clock=lambda: self.now)
+
+    def test_hit_and_miss_counters(self):
+        payload = {'sub': 'a', 'exp': 2000}
+        self.assertIsNone(self.cache.get('token-a'))
+        self.cache.set('token-a', payload)
+        self.assertIs(payload, self.cache.get('token-a').payload)
+        self.assertIs(payload, self.cache.get('token-a').payload)
+        self.assertEqual({'hits': 2, 'misses': 1, 'size': 1,
+                          'max_entries': 2}, self.cache.stats())
+
+    def test_entries_expire_at_exp_claim(self):
+        self.cache.set('token-a', {'sub': 'a', 'exp': 1500})
+        self.now = 1499
+        self.assertIsNotNone(self.cache.get('token-a'))
+        self.now = 1500
+        self.assertIsNone(self.cache.get('token-a'))
+        self.assertEqual(0, len(self.cache))
+
+    def test_tokens_without_valid_exp_are_not_cached(self):
+        self.cache.set('token-a', {'sub': 'a'})
+        self.cache.set('token-b', {'sub': 'b', 'exp': 900})
+        self.assertEqual(0, len(self.cache))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('token-a', {'sub': 'a', 'exp': 2000})
+        self.cache.set('token-b', {'sub': 'b', 'exp': 2000})
+        self.cache.get('token-a')
+        self.cache.set('token-c', {'sub': 'c', 'exp': 2000})
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.get('token-b'))
+        self.assertIsNotNone(self.cache.get('token-a'))
+        self.assertIsNotNone(self.cache.get('token-c'))
+
+    def test_raw_tokens_are_not_stored(self):
+        self.cache.set('secret-token', {'sub': 'a', 'exp': 2000})
+        self.assertNotIn('secret-token', self.cache._entries)
+
+    def test_permissions_are_cached_as_frozenset(self):
+        self.cache.set('token-a', {'sub': 'a', 'exp': 2000,
+                                   'permissions': ['get:actors',
+                                                   'get:movies']})
+        verified = self.cache.get('token-a')
+        self.assertEqual(frozenset(['get:actors', 'get:movies']),
+                         verified.permissions)
+
+        verified = self.cache.set('token-b', {'sub': 'b', 'exp': 2000})
+        self.assertIsNone(verified.permissions)
+
+    def test_zero_size_disables_cache(self):
+        cache = TokenCache(max_entries=0)
+        cache.set('token-a', {'sub': 'a', 'exp': time.time() + 60})
+        self.assertIsNone(cache.get('token-a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
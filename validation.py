@@ -0,0 +1,238 @@
+"""
+Validation of the request bodies, shared by the single and bulk create
+endpoints and the partial updates, which check each field with the same
+validator
+"""
+from datetime import date
+
+from model import MAX_ID, Actors, Movies
+
+
+class ValidationError(Exception):
+    """
+    Raised with the 400 message of an invalid request body
+    """
+
+
+def parse_id(value):
+    """
+    Returns value as a record id, None if it cannot reference a row
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    if value <= 0 or value > MAX_ID:
+        return None
+    return value
+
+
+def parse_release_date(value):
+    """
+    Parses a YYYY/M/D release date
+
+    :param value: release date
+    :type value: str
+    :rtype: date
+    """
+    try:
+        date_parts = value.split("/")
+        return date(int(date_parts[0]), int(date_parts[1]),
+                    int(date_parts[2]))
+    except:
+        raise ValidationError("Error in release date field format")
+
+
+def parse_text(name, value, max_length=None):
+    """
+    Returns value as the text of the name field
+
+    :param name: field name, for the error message
+    :type name: str
+    :param value: field value
+    :param max_length: most characters the column holds, None if unbounded
+    :type max_length: int
+    :rtype: str
+    """
+    if value is None:
+        raise ValidationError("Missing value for '{}' field".format(name))
+    if not isinstance(value, str):
+        raise ValidationError("Invalid value for '{}' field, expected a "
+                              "string".format(name))
+    if max_length is not None and len(value) > max_length:
+        raise ValidationError("Invalid value for '{}' field, expected at "
+                              "most {} characters".format(name, max_length))
+    return value
+
+
+def text_field(model, name):
+    """
+    Returns the validator of the text column name of model, bounded by the
+    length of the column
+    """
+    max_length = model.__table__.c[name].type.length
+    return lambda value: parse_text(name, value, max_length)
+
+
+def parse_age(value):
+    """
+    Returns value as a positive integer age, bounded to fit the column.
+    Only json integers are accepted, a float or a string is not truncated.
+    """
+    if isinstance(value, bool) or not isinstance(value, int) or \
+            value <= 0 or value > MAX_ID:
+        raise ValidationError(
+            "Invalid value '{}' for Int() age field".format(value))
+    return value
+
+
+def parse_request_count(value, maximum):
+    """
+    Returns value as a number of requests between 1 and maximum
+
+    :param value: number of requests
+    :type value: int
+    :param maximum: largest number of requests accepted
+    :type maximum: int
+    :rtype: int
+    """
+    if isinstance(value, bool) or not isinstance(value, int) or \
+            value < 1 or value > maximum:
+        raise ValidationError(
+            "Invalid value '{}' for requests, expected a number of requests "
+            "between 1 and {}".format(value, maximum))
+    return value
+
+
+def parse_gender(value):
+    gender = str(value)
+    if gender != 'male' and gender != 'female':
+        raise ValidationError("Invalid value '{}' for gender, acceptable "
+                              "values are male/female".format(gender))
+    return gender
+
+
+MOVIE_FIELDS = {
+    'title': text_field(Movies, 'title'),
+    'description': text_field(Movies, 'description'),
+    'release_date': parse_release_date
+}
+
+ACTOR_FIELDS = {
+    'name': text_field(Actors, 'name'),
+    'age': parse_age,
+    'gender': parse_gender,
+    'nationality': text_field(Actors, 'nationality')
+}
+
+
+def json_object(body):
+    """
+    Returns body, raises unless it is a json object
+    """
+    if not isinstance(body, dict):
+        raise ValidationError("Expected a json object")
+    return body
+
+
+def update_fields(body, validators):
+    """
+    Validates the fields of an update body present among validators, the
+    other fields are ignored
+
+    :param body: request body
+    :type body: dict
+    :param validators: validation function by field name
+    :type validators: dict
+    :return: column values of the fields to update
+    :rtype: dict
+    """
+    body = json_object(body or {})
+    return {name: validate(body[name])
+            for name, validate in validators.items() if name in body}
+
+
+def create_fields(body, validators):
+    """
+    Validates every field of validators, a missing field is validated as
+    null
+
+    :param body: request body
+    :type body: dict
+    :param validators: validation function by field name
+    :type validators: dict
+    :return: column values of the record
+    :rtype: dict
+    """
+    body = json_object(body)
+    return {name: validate(body.get(name))
+            for name, validate in validators.items()}
+
+
+def movie_updates(body):
+    return update_fields(body, MOVIE_FIELDS)
+
+
+def actor_updates(body):
+    return update_fields(body, ACTOR_FIELDS)
+
+
+def movie_fields(body):
+    """
+    Validates a movie request body
+
+    :param body: request body
+    :type body: dict
+    :return: column values of the movie
+    :rtype: dict
+    """
+    return create_fields(body, MOVIE_FIELDS)
+
+
+def actor_fields(body):
+    """
+    Validates an actor request body
+
+    :param body: request body
+    :type body: dict
+    :return: column values of the actor
+    :rtype: dict
+    """
+    return create_fields(body, ACTOR_FIELDS)
+
+
+def cast_fields(body):
+    """
+    Validates a cast request body
+
+    :param body: request body
+    :type body: dict
+    :return: column values of the cast
+    :rtype: dict
+    """
+    movie_id = parse_id(json_object(body).get('movie_id'))
+    if movie_id is None:
+        raise ValidationError(
+            "Movie id is invalid, please enter a valid Movie id")
+    return {'movie_id': movie_id}
+
+
+def star_fields(body):
+    """
+    Validates an actor assignment to cast request body
+
+    :param body: request body
+    :type body: dict
+    :return: column values of the assignment
+    :rtype: dict
+    """
+    body = json_object(body)
+    cast_id = parse_id(body.get('cast_id'))
+    actor_id = parse_id(body.get('actor_id'))
+    if cast_id is None:
+        raise ValidationError("Cast id does not exist")
+    if actor_id is None:
+        raise ValidationError("Actor id does not exist")
+    return {'cast_id': cast_id, 'actor_id': actor_id}